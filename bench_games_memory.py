@@ -0,0 +1,133 @@
+"""
+bench_games_memory.py
+
+Memory benchmark of games DataFrames: the layout of games_df (GAMES_DF_COLUMNS, mostly object columns) against
+the compact layout (nba.compact_games), for seasons of synthetic games.
+
+For every scenario (number of seasons) we report:
+- memory of the whole frame (deep) in MB and bytes per game, for both layouts,
+- peak memory (tracemalloc) and time of collecting the seasons day by day: with pd.concat of everything collected
+  so far for every day (the way days used to be combined) and with nba.GamesAccumulator.
+The script also checks that compact frames are scored exactly as games_df and that they convert back (expand_games)
+to the same text. Exit code is 1 when a check fails or the compact frame is not at most --max-ratio of games_df.
+
+Usage:
+    python bench_games_memory.py
+    python bench_games_memory.py --seasons 1 10 --max-ratio 0.3
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import random
+import sys
+import time
+import tracemalloc
+import pandas as pd
+import nbagames as nba
+
+GAMES_PER_SEASON = 1320  # regular season and playoffs
+DAYS_PER_SEASON = 180
+TEAMS = [(str(team_id), f"T{team_id:02d}") for team_id in range(1, 31)]
+
+
+# games of a season as games_df frames, one per day. Times of all games are formatted at once
+def season_days(season, rnd):
+    games_per_day = GAMES_PER_SEASON // DAYS_PER_SEASON
+    first_day = datetime.datetime(season, 10, 22, 23, 0)
+    starts = [first_day + datetime.timedelta(days=day, minutes=30 * rnd.randint(0, 7))
+              for day in range(DAYS_PER_SEASON) for _ in range(games_per_day)]
+    ends = [start + datetime.timedelta(hours=2, minutes=15) for start in starts]
+    times = nba.format_api_times([moment.strftime('%Y-%m-%dT%H:%M:%S.000Z') for moment in starts + ends])
+    times = times[['utc_str', 'et_str', 'et_date_str', 'cet_str']].to_numpy()
+
+    records = []
+    for i in range(len(starts)):
+        (v_id, visitor), (h_id, host) = rnd.sample(TEAMS, 2)
+        v_pts, h_pts = rnd.randint(85, 135), rnd.randint(85, 135)
+        start, end = times[i], times[len(starts) + i]
+        records.append(nba.GameRecord(
+            status='Finished',
+            start_time_utc=start[0], start_time_et=start[1], start_time_et_date=start[2], start_time_cet=start[3],
+            end_time_utc=end[0], end_time_et=end[1], end_time_cet=end[3],
+            v_team_id=v_id, v_pct=round(rnd.random(), 3), v_conf_rank=rnd.randint(1, 15), visitor=visitor,
+            visitor_pts=v_pts, host_pts=h_pts, host=host, h_conf_rank=rnd.randint(1, 15),
+            h_pct=round(rnd.random(), 3), h_team_id=h_id, points_diff=abs(v_pts - h_pts),
+            no_OT=rnd.choice([0, 0, 0, 0, 1]), no_OT2=0,
+            v_logo_link=f"https://media.api-sports.io/basketball/teams/{visitor}.png",
+            h_logo_link=f"https://media.api-sports.io/basketball/teams/{host}.png",
+            playoff=0, game_id=str(season * 10000 + i),
+            highest_pts=float(rnd.randint(20, 60)), pts_40=float(rnd.randint(0, 2)),
+            double_doubles=float(rnd.randint(0, 4)), triple_doubles=float(rnd.randint(0, 1)),
+            degraded='',
+        ))
+    return [nba.games_to_df(records[day * games_per_day:(day + 1) * games_per_day])
+            for day in range(DAYS_PER_SEASON)]
+
+
+def deep_mb(frame):
+    return frame.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+# peak memory (MB) and time (s) of a function
+def measure(function):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 / 1024
+    tracemalloc.stop()
+    return result, peak, elapsed
+
+
+def concat_in_loop(days):
+    games = pd.DataFrame()
+    for day in days:
+        games = pd.concat([games, day], ignore_index=True)
+    return games
+
+
+def accumulate(days):
+    games = nba.GamesAccumulator()
+    for day in days:
+        games.add(day)
+    return games.frame()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Memory benchmark of games DataFrames")
+    parser.add_argument("--seasons", type=int, nargs="+", default=[1, 5], help="scenarios: numbers of seasons")
+    parser.add_argument("--max-ratio", type=float, default=0.35,
+                        help="limit of memory of the compact frame relative to games_df")
+    args = parser.parse_args()
+
+    calculator = nba.NBAGamesScoringCalculator(False)
+    failed = False
+    print(f"{'seasons':>7}{'games':>8}{'games_df [MB]':>15}{'compact [MB]':>14}{'B/game':>14}"
+          f"{'concat peak [MB]':>18}{'[s]':>7}{'accumulator peak [MB]':>23}{'[s]':>7}")
+    for seasons in args.seasons:
+        rnd = random.Random(seasons)
+        days = [day for season in range(2015, 2015 + seasons) for day in season_days(season, rnd)]
+
+        games, concat_peak, concat_time = measure(lambda: concat_in_loop(days))
+        compact, accumulator_peak, accumulator_time = measure(lambda: accumulate(days))
+        ratio = deep_mb(compact) / deep_mb(games)
+        print(f"{seasons:>7}{len(games):>8}{deep_mb(games):>15.1f}{deep_mb(compact):>14.1f}"
+              f"{deep_mb(games) * 1024 * 1024 / len(games):>7.0f}/{deep_mb(compact) * 1024 * 1024 / len(games):<6.0f}"
+              f"{concat_peak:>18.1f}{concat_time:>7.2f}{accumulator_peak:>23.1f}{accumulator_time:>7.2f}")
+
+        same_scores = (calculator.calculate_vectorized(games).to_numpy()
+                       == calculator.calculate_vectorized(compact).to_numpy()).all()
+        same_text = games.to_csv(index=False) == nba.expand_games(compact).to_csv(index=False)
+        if not same_scores or not same_text:
+            print(f"    FAILED: scores {'match' if same_scores else 'differ'}, "
+                  f"text {'matches' if same_text else 'differs'}")
+            failed = True
+        if ratio > args.max_ratio:
+            print(f"    FAILED: compact frame is {ratio:.2f} of games_df, limit {args.max_ratio}")
+            failed = True
+
+    if failed:
+        sys.exit(1)
+    print("OK")
@@ -0,0 +1,316 @@
+"""
+bench_nbagames.py
+
+Offline benchmark of the scoring flow (what nba_games_scoring.py does for a date), without RapidAPI and without
+real waiting.
+
+The APIs are replaced by a local stand-in server (http.server) that serves synthetic payloads for
+/games/date/, /standings/..., /statistics/players/gameId/ and api-basketball /games - or, with --recorded,
+responses recorded in the response cache (API_CACHE_DIR). The collector is pointed at it with API_NBA_URL and
+API_BASKETBALL_URL. The rate limiter runs on a virtual clock: it still enforces per-minute limits of our plans,
+but its sleeps only move the virtual time forward, so we can see how long a run would take because of the limits
+("quota time") without actually waiting.
+
+For every scenario (number of games on the date) we report:
+- wall time of the flow in seconds,
+- quota time: simulated seconds the flow needs within the per-minute limits,
+- number of requests to every endpoint,
+- peak memory (tracemalloc) in MB.
+Numbers are compared with the baseline (bench_nbagames_baseline.json). Request counts and quota time must not grow,
+wall time and memory may grow by the given tolerance. Exit code is 1 on regression.
+
+Usage:
+    python bench_nbagames.py
+    python bench_nbagames.py --scenarios 1 15 --tolerance 0.5
+    python bench_nbagames.py --update-baseline
+    python bench_nbagames.py --recorded ./cache/responses --date 2025-01-10
+
+Wall time and memory depend on the machine, so the baseline should be recorded (--update-baseline) on the machine
+the benchmark is run on.
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import glob
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+import nbagames as nba
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench_nbagames_baseline.json")
+SCENARIOS = [1, 15, 1000]
+DATE = datetime.date(2025, 1, 10)  # ET date of synthetic games
+SEASON = 2024
+TEAMS = [(str(team_id), f"T{team_id:02d}", f"Team {team_id:02d}") for team_id in range(1, 31)]
+# Small scenarios take fractions of a second, so on top of the relative tolerance we allow some absolute noise
+WALL_SLACK = 0.5  # seconds
+MEMORY_SLACK = 0.5  # MB
+
+
+# Time that moves only when somebody sleeps. A thread sleeps from the time it last read the clock, so threads
+# sleeping at the same time wait together: the clock moves to the latest wake up time, not by the sum of all sleeps
+class VirtualClock:
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+        self.seen = threading.local()  # time the current thread last read
+
+    def time(self):
+        with self.lock:
+            self.seen.now = self.now
+            return self.now
+
+    def sleep(self, seconds):
+        with self.lock:
+            self.now = max(self.now, getattr(self.seen, "now", self.now) + seconds)
+            self.seen.now = self.now
+
+
+# Synthetic league: no_of_games games on DATE in ET (most of them start after midnight UTC, so they are in
+# the schedule of the day after, as in reality), plus a few games of the days before and after, which the flow
+# has to filter out
+class SyntheticAPI:
+    def __init__(self, no_of_games, seed=0):
+        rnd = random.Random(seed)
+        self.games = {}  # UTC date -> list of games in the api-nba format
+        et_start = datetime.datetime(DATE.year, DATE.month, DATE.day, 19, tzinfo=datetime.timezone.utc)
+        games = [(et_start + datetime.timedelta(hours=5, minutes=rnd.randint(0, 240)), i) for i in range(no_of_games)]
+        games += [(et_start - datetime.timedelta(hours=20), no_of_games),  # ET day before
+                  (et_start + datetime.timedelta(days=1, hours=4), no_of_games + 1)]  # ET day after
+        for start, i in games:
+            visitor, host = rnd.sample(TEAMS, 2)
+            v_points, h_points = rnd.randint(85, 135), rnd.randint(85, 135)
+            periods = rnd.choice(["4/4"] * 8 + ["5/4", "6/4"])
+            self.games.setdefault(str(start.date()), []).append({
+                "gameId": str(10000 + i),
+                "statusGame": "Finished",
+                "startTimeUTC": start.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                "endTimeUTC": (start + datetime.timedelta(hours=2, minutes=15)).strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+                "currentPeriod": periods,
+                "vTeam": {"teamId": visitor[0], "shortName": visitor[1], "fullName": visitor[2],
+                          "logo": f"https://example.com/{visitor[1]}.png", "score": {"points": str(v_points)}},
+                "hTeam": {"teamId": host[0], "shortName": host[1], "fullName": host[2],
+                          "logo": f"https://example.com/{host[1]}.png",
+                          "score": {"points": str(h_points + (h_points == v_points))}},
+            })
+
+    @staticmethod
+    def standing(team_id):
+        rnd = random.Random(team_id)
+        return {"teamId": team_id, "conference": {"rank": str(rnd.randint(1, 15))},
+                "winPercentage": f"{rnd.random():.3f}"}
+
+    # returns the payload for an API path (without the base URL) and its query parameters, None if not found
+    def response(self, api, path, params):
+        if api == "basketball" and path == "/games":
+            games = self.games.get(params.get("date"), [])
+            return {"results": len(games), "response": [{
+                "date": game["startTimeUTC"].replace(".000Z", "+00:00"),
+                "teams": {"home": {"name": game["hTeam"]["fullName"]}, "away": {"name": game["vTeam"]["fullName"]}},
+                "scores": {"home": {"over_time": 9 if game["currentPeriod"] != "4/4" else None}},
+            } for game in games]}
+        if api != "nba":
+            return None
+
+        match = re.fullmatch(r"/games/date/(.+)", path)
+        if match:
+            games = self.games.get(match.group(1), [])
+            return {"api": {"status": 200, "results": len(games), "games": games}}
+        match = re.fullmatch(r"/standings/standard/\d+/teamId/(.+)", path)
+        if match:
+            return {"api": {"results": 1, "standings": [self.standing(match.group(1))]}}
+        if re.fullmatch(r"/standings/standard/\d+/?", path):
+            return {"api": {"results": len(TEAMS), "standings": [self.standing(team[0]) for team in TEAMS]}}
+        match = re.fullmatch(r"/statistics/players/gameId/(.+)", path)
+        if match:
+            rnd = random.Random(match.group(1))
+            players = [{"points": str(rnd.randint(0, 50)), "totReb": str(rnd.randint(0, 15)),
+                        "assists": str(rnd.randint(0, 12))} for _ in range(26)]
+            return {"api": {"results": len(players), "statistics": players}}
+        return None
+
+
+# Responses recorded in the response cache, served by the path and parameters they were requested with
+class RecordedAPI:
+    def __init__(self, directory):
+        self.responses = {}
+        for file_name in glob.glob(os.path.join(directory, "*", "*.json")):
+            with open(file_name, "r") as f:
+                entry = json.load(f)
+            url = urlsplit(entry['url'])
+            api = "basketball" if url.netloc == nba.NBAGamesDataCollector.API_BASKETBALL_HOST else "nba"
+            self.responses[self.key(api, url.path, entry['params'] or {})] = entry['data']
+
+    @staticmethod
+    def key(api, path, params):
+        return api, path.rstrip("/"), json.dumps({k: str(v) for k, v in params.items()}, sort_keys=True)
+
+    def response(self, api, path, params):
+        return self.responses.get(self.key(api, path, params))
+
+
+# Local stand-in server. api-nba is served under /nba, api-basketball under /basketball. Requests are counted
+# per endpoint (path without ids and dates)
+class StandInServer:
+    def __init__(self, api):
+        self.api = api
+        self.requests = {}
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlsplit(self.path)
+                api, _, path = url.path.lstrip("/").partition("/")
+                endpoint = api + "/" + re.sub(r"/(\d[\d-]*)(?=/|$)", "/{id}", path)
+                with server.lock:
+                    server.requests[endpoint] = server.requests.get(endpoint, 0) + 1
+
+                data = server.api.response(api, "/" + path, dict(parse_qsl(url.query)))
+                body = json.dumps(data if data is not None else {"message": "Not found"}).encode()
+                self.send_response(200 if data is not None else 404)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+# the flow of nba_games_scoring.py for a date, with the rate limiter on the virtual clock.
+# Runs in the current directory (all files the flow writes go there). Returns the number of scored games
+def scoring_flow(date, season, clock):
+    per_minute = {host: limits[0] for host, limits in nba.NBAGamesDataCollector.API_LIMITS.items()}
+    # daily quotas are not simulated - a large scenario would not fit in them anyway
+    rate_limiter = nba.APIRateLimiter({host: (limit, math.inf) for host, limit in per_minute.items()},
+                                      clock=clock.time, sleep=clock.sleep)
+    response_cache = nba.ResponseCache("./cache/responses")
+    games_state = nba.NBAGamesStateStore("./cache/games-state.json")
+
+    calculator = nba.NBAGamesScoringCalculator(False, rate_limiter, response_cache, games_state, season)
+    calculator.get_playoff_data()
+    if calculator.collect_games(date) == 0:
+        return 0
+    games = calculator.calculate_score()
+    nba.print_scoring_csv(games, date.strftime('%Y-%m-%d'), playoff_mode=False)
+    return len(games)
+
+
+# runs a scenario twice in fresh directories: once for wall time and requests, once (with tracemalloc) for memory
+def run_scenario(api, date, season):
+    server = StandInServer(api)
+    os.environ["API_NBA_URL"] = server.url + "/nba"
+    os.environ["API_BASKETBALL_URL"] = server.url + "/basketball"
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            os.makedirs("scoring")
+            clock = VirtualClock()
+            start = time.perf_counter()
+            no_of_games = scoring_flow(date, season, clock)
+            wall_time = time.perf_counter() - start
+            requests = dict(sorted(server.requests.items()))
+
+        with tempfile.TemporaryDirectory() as directory:
+            os.chdir(directory)
+            os.makedirs("scoring")
+            tracemalloc.start()
+            scoring_flow(date, season, VirtualClock())
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        server.close()
+
+    return {
+        "games": no_of_games,
+        "wall_s": round(wall_time, 3),
+        "quota_s": round(clock.time(), 1),
+        "requests": requests,
+        "total_requests": sum(requests.values()),
+        "peak_mb": round(peak_memory / 2 ** 20, 2),
+    }
+
+
+# list of regressions of a result against its baseline
+def compare(result, baseline, tolerance):
+    problems = []
+    if result["total_requests"] > baseline["total_requests"]:
+        problems.append(f"requests {baseline['total_requests']} -> {result['total_requests']}")
+    if result["quota_s"] > baseline["quota_s"] * 1.01:
+        problems.append(f"quota time {baseline['quota_s']} s -> {result['quota_s']} s")
+    if result["wall_s"] > baseline["wall_s"] * (1 + tolerance) + WALL_SLACK:
+        problems.append(f"wall time {baseline['wall_s']} s -> {result['wall_s']} s")
+    if result["peak_mb"] > baseline["peak_mb"] * (1 + tolerance) + MEMORY_SLACK:
+        problems.append(f"peak memory {baseline['peak_mb']} MB -> {result['peak_mb']} MB")
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline benchmark of the scoring flow")
+    parser.add_argument("--scenarios", type=int, nargs="+", default=SCENARIOS, help="numbers of games on the date")
+    parser.add_argument("--recorded", help="serve responses recorded in this response cache directory instead")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="ET date of the recorded games")
+    parser.add_argument("--season", type=int, help="season the games were recorded with (by default of the date)")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file")
+    parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.3,
+                        help="allowed relative growth of wall time and peak memory")
+    args = parser.parse_args()
+
+    if args.recorded:
+        if args.date is None:
+            parser.error("--date is required with --recorded")
+        season = args.season or nba.season_of(args.date)
+        scenarios = {f"recorded {args.date}": (RecordedAPI(args.recorded), args.date, season)}
+    else:
+        scenarios = {f"{n} games": (SyntheticAPI(n), DATE, SEASON) for n in args.scenarios}
+
+    try:
+        with open(args.baseline, "r") as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    results, failed = {}, False
+    print(f"{'scenario':<24}{'games':>6}{'wall [s]':>10}{'quota [s]':>11}{'requests':>10}{'peak [MB]':>11}")
+    for name, (api, date, season) in scenarios.items():
+        result = run_scenario(api, date, season)
+        results[name] = result
+        print(f"{name:<24}{result['games']:>6}{result['wall_s']:>10.3f}{result['quota_s']:>11.1f}"
+              f"{result['total_requests']:>10}{result['peak_mb']:>11.2f}")
+        if name in baselines and not args.update_baseline:
+            problems = compare(result, baselines[name], args.tolerance)
+            if problems:
+                failed = True
+                print("    REGRESSION:", "; ".join(problems))
+
+    if args.update_baseline:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+        print("Baseline written to", args.baseline)
+    elif failed:
+        sys.exit(1)
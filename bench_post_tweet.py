@@ -0,0 +1,104 @@
+"""
+bench_post_tweet.py
+
+Measures start-up time and memory (peak RSS) of post-tweet.py, so we notice when it gets heavy again.
+
+post-tweet.py is run in a temporary directory for the paths that do not post anything: no ranking file,
+a ranking without games and a dry run with a full ranking. Every path is run a few times and the best wall time
+and the highest peak RSS are compared with the limits. The script also checks that none of the heavy modules
+(pandas, numpy, pytz, tweepy) gets imported on these paths. Exit code is 1 when any check fails.
+
+Usage:
+    python bench_post_tweet.py
+    python bench_post_tweet.py --runs 10 --max-seconds 0.3 --max-rss-mb 30
+
+Linux/macOS only (uses os.wait4).
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "post-tweet.py")
+HEAVY_MODULES = ("pandas", "numpy", "pytz", "tweepy")
+RANKING_HEADER = ['Visitor', 'Host', 'SCORE: 0 - 100']
+
+
+# writes a ranking file for yesterday with the given number of games to the scoring dir
+def write_ranking(directory, no_of_games):
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    with open(os.path.join(directory, "scoring", f"scoring-{yesterday}.csv"), "w", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(RANKING_HEADER)
+        for i in range(no_of_games):
+            writer.writerow([f"Visitor {i}", f"Host {i}", 100 - i % 100])
+
+
+# runs post-tweet.py once, returns wall time in seconds, peak RSS in MB and the -X importtime output
+def run_once(directory, args):
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-X", "importtime", SCRIPT] + args, cwd=directory,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    stderr = process.stderr.read().decode()
+    _, status, usage = os.wait4(process.pid, 0)
+    process.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss_mb = usage.ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    return elapsed, rss_mb, stderr
+
+
+# names of top level modules imported by the run
+def imported_modules(importtime_output):
+    modules = set()
+    for line in importtime_output.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            modules.add(line.rsplit("|", 1)[1].strip().split(".")[0])
+    return modules
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Start-up time and memory benchmark of post-tweet.py")
+    parser.add_argument("--runs", type=int, default=5, help="runs of every scenario")
+    parser.add_argument("--max-seconds", type=float, default=0.5, help="limit of the best wall time of a scenario")
+    parser.add_argument("--max-rss-mb", type=float, default=40, help="limit of the peak RSS of a scenario")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("no ranking file", None, []),
+        ("no games", 0, []),
+        ("dry run, 1000 games", 1000, ["--dry-run"]),
+    ]
+
+    failed = False
+    print(f"{'scenario':<22}{'best [s]':>10}{'peak RSS [MB]':>15}  heavy imports")
+    for name, no_of_games, script_args in scenarios:
+        with tempfile.TemporaryDirectory() as directory:
+            os.makedirs(os.path.join(directory, "scoring"))
+            os.makedirs(os.path.join(directory, "log"))
+            if no_of_games is not None:
+                write_ranking(directory, no_of_games)
+
+            times, peak_rss, heavy = [], 0, set()
+            for _ in range(args.runs):
+                elapsed, rss_mb, importtime_output = run_once(directory, script_args)
+                times.append(elapsed)
+                peak_rss = max(peak_rss, rss_mb)
+                heavy |= imported_modules(importtime_output) & set(HEAVY_MODULES)
+
+        best = min(times)
+        print(f"{name:<22}{best:>10.3f}{peak_rss:>15.1f}  {', '.join(sorted(heavy)) or '-'}")
+        if best > args.max_seconds or peak_rss > args.max_rss_mb or heavy:
+            failed = True
+
+    if failed:
+        print(f"FAILED: limits are {args.max_seconds} s, {args.max_rss_mb} MB and no heavy imports")
+        sys.exit(1)
+    print("OK")
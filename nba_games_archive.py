@@ -0,0 +1,53 @@
+"""
+nba_games_archive.py
+
+Reads the archive of raw API responses (./archive, see NBAPayloadArchive in nbagames.py) for audits and offline
+re-scoring. Only the index is scanned to find responses; only the responses listed or shown are decompressed.
+
+Usage:
+    python nba_games_archive.py --date 2025-01-10                        # list responses about a date
+    python nba_games_archive.py --game-id 14012 --kind box_score --show  # print the latest box score of a game
+    python nba_games_archive.py --stats                                  # size of the archive by kind
+    python nba_games_archive.py --league wnba --date 2025-07-10          # the archive of another league
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import os
+import nbagames as nba
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Read the archive of raw API responses")
+    parser.add_argument("--dir", default=os.getenv("API_ARCHIVE_DIR", nba.NBAGamesDataCollector.ARCHIVE_DIR),
+                        help="directory of the archive")
+    parser.add_argument("--league", choices=list(nba.LEAGUES), default='nba',
+                        help="league of the archive (leagues other than the NBA have their own, e.g. ./archive-wnba)")
+    parser.add_argument("--kind", choices=list(nba.NBAPayloadArchive.KINDS), help="kind of responses")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="date the responses are about")
+    parser.add_argument("--game-id", help="GameId the responses are about")
+    parser.add_argument("--show", action="store_true", help="print the body of the latest matching response")
+    parser.add_argument("--stats", action="store_true", help="number and compressed size of responses by kind")
+    args = parser.parse_args()
+
+    archive = nba.NBAPayloadArchive(nba.LEAGUES[args.league].file_name(args.dir))
+    entries = archive.find(args.kind, args.date, args.game_id)
+    kinds = {number: name for name, number in nba.NBAPayloadArchive.KINDS.items()}
+
+    if args.stats:
+        for number, name in sorted(kinds.items()):
+            of_kind = entries[entries['kind'] == number]
+            print(f"{name:<16}{len(of_kind):>8} responses{of_kind['length'].sum() / 1024 / 1024:>10.1f} MB")
+    elif args.show:
+        if len(entries) == 0:
+            print("No such response in the archive")
+            exit(1)
+        header, body = archive.read(entries[-1])
+        print(body.decode("utf-8"))
+    else:
+        for entry in entries:
+            header, _ = archive.read(entry)
+            fetched_at = datetime.datetime.fromtimestamp(float(entry['fetched_at'])).isoformat(timespec='seconds')
+            print(f"{fetched_at}  {kinds[int(entry['kind'])]:<15} {int(entry['date']) or '-'!s:<9} "
+                  f"{int(entry['game_id']) or '-'!s:<10} {header['url']} {header['params'] or ''}")
@@ -0,0 +1,162 @@
+"""
+nba_games_backfill.py
+
+Calculates rankings for a whole season or a range of dates, e.g. to rebuild rankings of past seasons.
+
+Every date is a separate job. Jobs run in parallel in a pool of workers that share limits of our API plans
+(and the response cache), so the backfill goes as fast as the quota allows. Dates that are done are written
+to a checkpoint file, so after a crash or when the daily quota is used up, running the same command again
+resumes where it stopped. Rankings of all dates are appended to a ranking store of the backfill
+(./scoring/backfill/rankings-<name>.sqlite) and scored games of all dates, with all their data, go into one
+consolidated CSV file. Rankings of the backfill are not written to the ranking store of the daily runs, as they are
+calculated with current standings (see the note below) and would replace the rankings that were published.
+
+Usage:
+    python nba_games_backfill.py --season 2024
+    python nba_games_backfill.py --start 2025-01-01 --end 2025-01-31 --workers 2
+
+Note: the API gives current standings only, so conference ranks and win PCT of past games are the ones
+at the time of the backfill.
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import pandas as pd
+import nbagames as nba
+
+BACKFILL_DIR = "./scoring/backfill"
+
+
+# Dates that are already done (date -> number of games) are kept in a JSON file, written after each date
+class BackfillCheckpoint:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.lock = threading.Lock()
+        try:
+            with open(file_name, "r") as f:
+                self.done = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.done = {}
+
+    def is_done(self, date: datetime.date):
+        return str(date) in self.done
+
+    def mark_done(self, date: datetime.date, no_of_games):
+        with self.lock:
+            self.done[str(date)] = no_of_games
+            tmp_file_name = self.file_name + ".tmp"
+            with open(tmp_file_name, "w") as f:
+                json.dump(self.done, f, indent=1, sort_keys=True)
+            os.replace(tmp_file_name, self.file_name)
+
+
+# all dates from start to end (inclusive)
+def date_range(start: datetime.date, end: datetime.date):
+    return [start + datetime.timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+# a single job: collects games played on a date in ET and scores them. Returns scored games (may be empty)
+def score_date(date: datetime.date, playoff, rate_limiter, response_cache, games_state, metrics):
+    calculator = nba.NBAGamesScoringCalculator(playoff, rate_limiter, response_cache, games_state,
+                                               season=nba.season_of(date), metrics=metrics)
+    calculator.get_playoff_data()
+    if calculator.collect_games(date) == 0:
+        return pd.DataFrame()
+
+    games = calculator.calculate_score()
+    games.insert(0, 'Date', str(date))
+    return games
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculate rankings for a season or a range of dates")
+    parser.add_argument("--season", type=int, help="season as the year it starts in, e.g. 2024 for 2024-2025")
+    parser.add_argument("--start", type=datetime.date.fromisoformat, help="first date (yyyy-mm-dd)")
+    parser.add_argument("--end", type=datetime.date.fromisoformat, help="last date (yyyy-mm-dd)")
+    parser.add_argument("--workers", type=int, default=nba.NBAGamesDataCollector.API_WORKERS,
+                        help="number of dates processed at the same time")
+    parser.add_argument("--playoff", action="store_true", help="include playoff scoring")
+    args = parser.parse_args()
+
+    # we never go further than yesterday - games of today are not finished yet
+    yesterday = datetime.date.today() - datetime.timedelta(days=1)
+    if args.season is not None:
+        # NBA season, including playoffs, lasts from October till June
+        start = args.start or datetime.date(args.season, 10, 1)
+        end = args.end or datetime.date(args.season + 1, 6, 30)
+        name = str(args.season)
+    elif args.start is not None:
+        start = args.start
+        end = args.end or yesterday
+        name = f"{start}_{end}"
+    else:
+        parser.error("either --season or --start is required")
+    end = min(end, yesterday)
+
+    os.makedirs(BACKFILL_DIR, exist_ok=True)
+    po = "-po" if args.playoff else ""  # PLAYOFF2021
+    checkpoint = BackfillCheckpoint(f"{BACKFILL_DIR}/checkpoint-{name}{po}.json")
+    results_file = f"{BACKFILL_DIR}/scoring-{name}{po}.csv"
+    results_lock = threading.Lock()
+    store = nba.NBARankingStore(f"{BACKFILL_DIR}/rankings-{name}{po}.sqlite")
+
+    dates = [date for date in date_range(start, end) if not checkpoint.is_done(date)]
+    print(f"Backfill {start} - {end}: {len(dates)} dates to process")
+
+    # All workers share the same rate limiter, response cache, games state and metrics
+    collector = nba.NBAGamesDataCollector(args.playoff)
+    rate_limiter, response_cache, games_state = collector.rate_limiter, collector.response_cache, collector.games_state
+    metrics = collector.metrics
+
+    # standings of every season are requested once here, so workers do not ask for them at the same time
+    for season in sorted({nba.season_of(date) for date in dates}):
+        nba.NBAGamesDataCollector(args.playoff, rate_limiter, response_cache, games_state, season,
+                                  metrics).get_standings()
+
+    quota_exceeded = False
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        jobs = {pool.submit(score_date, date, args.playoff, rate_limiter, response_cache, games_state, metrics): date
+                for date in dates}
+        for job in as_completed(jobs):
+            date = jobs[job]
+            if job.cancelled():
+                continue
+            try:
+                games = job.result()
+            except nba.APIQuotaExceeded as e:
+                # there is no point in starting other dates - we stop and resume another day
+                if not quota_exceeded:
+                    print(f"{e}. Stopping, run the same command again to resume.")
+                    quota_exceeded = True
+                    for other in jobs:
+                        other.cancel()
+                continue
+            except nba.APIRequestFailed as e:
+                # the date is not checkpointed, so it will be retried when the backfill is resumed
+                print(f"{date}: {e}")
+                continue
+
+            # results are appended first and the date is checkpointed after that. If we crash in between, the date
+            # is processed again and its games are written twice, so the file is deduplicated by GameId at the end
+            with results_lock:
+                if len(games) > 0:
+                    store.append(games, str(date), args.playoff)
+                    games.to_csv(results_file, mode="a", index=False, header=not os.path.exists(results_file))
+                checkpoint.mark_done(date, len(games))
+            print(f"{date}: {len(games)} games")
+
+    # the file may hold many seasons, so it is read in chunks into the compact layout (see nba.compact_games)
+    if os.path.exists(results_file):
+        results = nba.read_games_csv(results_file)
+        results = results.drop_duplicates(subset=['GameId'], keep='last').sort_values(by=['Date', 'SCORE: 0 - 100'],
+                                                                                      ascending=[True, False])
+        nba.expand_games(results).to_csv(results_file, index=False)
+        print(f"{len(results)} games from {len(checkpoint.done)} dates in {results_file}")
+
+    collector.write_metrics(f"{BACKFILL_DIR}/metrics-{name}{po}")
@@ -0,0 +1,205 @@
+"""
+nba_games_daemon.py
+
+Calculates the ranking of a date while the games are played, instead of the next day.
+
+The daemon polls the schedule of the date and scores every game (standings, box score, OTs) once, as soon as
+its status is 'Finished'. The ranking is published (ranking store, CSV file and the ready marker post-tweet.py
+waits for) right after the last game of the date in ET ends, i.e. minutes after the final buzzer.
+
+Polling is adaptive, so we use about the same number of API calls as the daily run: when no game is about to end
+we sleep until the expected end of the next game (up to MAX_INTERVAL), when a game is overdue we poll every
+MIN_INTERVAL at first and less often the longer it is overdue. Only schedules of UTC dates that still have games in play are requested and
+the schedule is the only endpoint polled - other data is requested once per finished game.
+
+Usage:
+    python nba_games_daemon.py                    # games of today in ET
+    python nba_games_daemon.py --date 2025-01-10
+    python nba_games_daemon.py --forever          # after the date is published, go on with the next one when it begins
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import time
+import pytz
+import pandas as pd
+import nbagames as nba
+
+playoff = False
+
+
+class NBAGamesDaemon:
+    # NBA games take about 2 h 15 min. We expect a game to end that long after its start
+    EXPECTED_GAME_LENGTH = datetime.timedelta(hours=2, minutes=20)
+    # A game that is not finished that long after its start (postponed, suspended, missing in the API)
+    # does not hold up the ranking
+    GIVE_UP_AFTER = datetime.timedelta(hours=6)
+    MIN_INTERVAL = 5 * 60  # seconds, when a game is expected to end any minute
+    MAX_INTERVAL = 60 * 60  # seconds, when nothing is going to happen for a while
+
+    # clock returns the current time in UTC (tz-aware), sleep waits for the given number of seconds
+    def __init__(self, calculator: nba.NBAGamesScoringCalculator, et_date: datetime.date,
+                 clock=lambda: datetime.datetime.now(datetime.timezone.utc), sleep=time.sleep):
+        self.calculator = calculator
+        self.et_date = et_date
+        self.clock = clock
+        self.sleep = sleep
+        # The API returns games for a date in UTC, so games of et_date are in schedules of et_date and the day after
+        self.schedules = {date: [] for date in [et_date, et_date + datetime.timedelta(days=1)]}
+        self.polled = set()  # UTC dates we have the schedule of
+        self.scored = set()  # GameIds of finished games that are already scored
+
+    # all games of et_date in ET from the last schedules we got, finished or not, as ScheduledGame records with
+    # their start time (tz-aware UTC). A game listed more than once is finished if any of its entries is finished
+    def games_of_date(self):
+        games = {}
+        for date_games in self.schedules.values():
+            for game in date_games:
+                game = nba.ScheduledGame.from_api(game)
+                if game is None:
+                    continue
+                if game.game_id not in games or game.status == 'Finished':
+                    games[game.game_id] = game
+        if not games:
+            return []
+
+        games = list(games.values())
+        start_times = nba.format_api_times([game.start_time_utc for game in games])
+        on_et_date = (start_times['et_day'] == pd.Timestamp(self.et_date)).to_numpy()
+        return [(game, start) for game, start, keep in zip(games, start_times['utc'], on_et_date) if keep]
+
+    # games that are not finished yet and are still worth waiting for
+    def pending(self, games, now):
+        return [(game, start) for game, start in games
+                if game.status != 'Finished' and (pd.isna(start) or now < start + self.GIVE_UP_AFTER)]
+
+    # UTC dates (schedules) that have pending games. Until we have seen a schedule, we have to ask for it
+    def dates_to_poll(self, pending):
+        dates = {date for date in self.schedules if date not in self.polled}
+        for game, start in pending:
+            if pd.isna(start):
+                dates |= set(self.schedules)
+            else:
+                dates.add(start.date())
+        return sorted(date for date in dates if date in self.schedules)
+
+    # seconds to the next poll: until the first pending game is expected to end, but not longer than MAX_INTERVAL.
+    # A game that is overdue (e.g. OT) is checked every MIN_INTERVAL at first, then less and less often (a third
+    # of the time it is overdue), so a game that is stuck does not make us poll every few minutes for hours
+    def next_poll_in(self, pending, now):
+        seconds = self.MAX_INTERVAL
+        for game, start in pending:
+            if pd.isna(start):
+                return self.MIN_INTERVAL
+            to_end = (start + self.EXPECTED_GAME_LENGTH - now).total_seconds()
+            seconds = min(seconds, to_end if to_end > 0 else -to_end / 3)
+        return min(max(seconds, self.MIN_INTERVAL), self.MAX_INTERVAL)
+
+    # one poll: gets schedules that may have changed and scores games that have finished since the last poll.
+    # Returns pending games
+    def poll(self):
+        now = self.clock()
+        for date in self.dates_to_poll(self.pending(self.games_of_date(), now)):
+            self.schedules[date] = self.calculator.get_schedule(date, fresh=True).data['api']['games']
+            self.polled.add(date)
+
+        games = self.games_of_date()
+        finished = [game for game, start in games if game.status == 'Finished' and game.game_id not in self.scored]
+        if finished:
+            self.score(finished)
+        return self.pending(games, now)
+
+    # Games that have just finished are enriched and scored. We ask api-basketball for OTs only for dates of these
+    # games. Games scored earlier are taken from the games state store, so they cost no API calls
+    def score(self, finished):
+        start_times = nba.format_api_times([game.start_time_utc for game in finished])
+        dates = sorted({start.date() for start in start_times['utc'] if not pd.isna(start)} & set(self.schedules))
+
+        self.calculator.request_games_api_basketball = None
+        for date in self.calculator.ot_dates_in_budget(dates):
+            data = self.calculator.get_games_data_api_basketball(date, fresh=True)
+            if data is not None:
+                if self.calculator.request_games_api_basketball is None:
+                    self.calculator.request_games_api_basketball = {'response': []}
+                self.calculator.request_games_api_basketball['response'] += data.get('response', [])
+        self.calculator.build_ot_index()
+
+        all_games = [game for date_games in self.schedules.values() for game in date_games]
+        self.calculator.get_games_stats(et_date=self.et_date, games=all_games)
+        self.calculator.calculate_score()
+        for game in finished:
+            self.scored.add(game.game_id)
+            print(f"{self.clock():%H:%M} UTC: {game.v_short_name} - {game.h_short_name} finished and scored")
+
+    # polls until all games of the date are finished (or given up on). Returns scored games
+    def run(self):
+        while True:
+            try:
+                pending = self.poll()
+            except nba.APIRequestFailed as e:
+                # we try again with the next poll
+                print(e)
+                pending = None
+
+            if pending is not None and self.polled == set(self.schedules) and not pending:
+                break
+
+            if pending is None:
+                seconds = self.MIN_INTERVAL
+            else:
+                seconds = self.next_poll_in(pending, self.clock())
+                print(f"{self.clock():%H:%M} UTC: {len(pending)} games to go, next poll in {seconds / 60:.0f} min")
+            self.sleep(seconds)
+
+        return self.calculator.games_df
+
+
+# seconds until a date begins in ET (negative if it already has)
+def seconds_until(et_date: datetime.date, now=None):
+    eastern = pytz.timezone(nba.TIME_ZONE_ET)
+    start = eastern.localize(datetime.datetime.combine(et_date, datetime.time()))
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return (start - now).total_seconds()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculate the ranking of a date as soon as its games end")
+    parser.add_argument("--date", type=datetime.date.fromisoformat, help="date in ET (yyyy-mm-dd), today by default")
+    parser.add_argument("--forever", action="store_true", help="go on with the next date when one is published")
+    args = parser.parse_args()
+
+    date = args.date or datetime.datetime.now(pytz.timezone(nba.TIME_ZONE_ET)).date()
+    while True:
+        calculator = nba.NBAGamesScoringCalculator(playoff, season=nba.season_of(date))
+        calculator.get_playoff_data()
+        date_str = date.strftime('%Y-%m-%d')
+
+        try:
+            games = NBAGamesDaemon(calculator, date).run()
+        except nba.APIQuotaExceeded as e:
+            print(f"{e}. The ranking of {date_str} was not published.")
+            exit(1)
+
+        # the ranking is published as the daily run does it. post-tweet.py waits for the ready marker
+        if len(games) == 0:
+            print("No games to evaluate on", date)
+            nba.write_ready_marker(date_str, 0, playoff_mode=playoff)
+        else:
+            with calculator.metrics.stage("publish"):
+                nba.print_scoring_csv(games, date_str, playoff_mode=playoff)
+            print(f"Ranking of {date_str} with {len(games)} games published")
+        calculator.write_metrics("./scoring/metrics-" + date_str)
+
+        if not args.forever:
+            break
+        date += datetime.timedelta(days=1)
+        # We never go ahead of the calendar: the next date is started when it begins in ET. After a date without
+        # games (e.g. after the Finals) we wait at least MAX_INTERVAL anyway, so empty dates do not use up the quota
+        seconds = seconds_until(date)
+        if len(games) == 0:
+            seconds = max(seconds, NBAGamesDaemon.MAX_INTERVAL)
+        if seconds > 0:
+            print(f"Next date {date}, starting in {seconds / 60:.0f} min")
+            time.sleep(seconds)
@@ -0,0 +1,87 @@
+"""
+nba_games_leagues.py
+
+Calculates rankings of the previous day for many leagues at once, e.g. the NBA, WNBA and G League (see LEAGUES
+in nbagames.py), instead of a separate cron job for every league.
+
+Every league is a separate job with its own calculator, run in parallel in a pool of workers. Workers share limits
+of our API plans (per host) and the response cache, so adding a league costs only its API calls. Everything else
+is per league: games state, standings, the ranking store, CSV files, ready markers and metrics go to the directory
+of the league (./scoring for the NBA, as the daily run, ./scoring/<league> for the others).
+
+Leagues are taken from LEAGUES in .env file (e.g. LEAGUES=nba,wnba,gleague), the NBA only by default.
+
+Usage:
+    python nba_games_leagues.py
+    python nba_games_leagues.py --leagues wnba gleague --date 2025-07-10
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv, find_dotenv
+import nbagames as nba
+
+playoff = False  # playoff scoring applies to the NBA only (./scoring/playoff.csv)
+
+
+# a single job: collects games of a league played on a date in ET, scores and publishes them.
+# Returns the number of games ranked
+def rank_league(league: nba.League, date: datetime.date, rate_limiter, response_cache):
+    calculator = nba.NBAGamesScoringCalculator(playoff and league.api_nba, rate_limiter, response_cache,
+                                               season=league.season_of(date), league=league)
+    calculator.get_playoff_data()
+    date_str = date.strftime('%Y-%m-%d')
+
+    try:
+        if calculator.collect_games(date) == 0:
+            nba.write_ready_marker(date_str, 0, calculator.playoff_mode, league.scoring_dir)
+            return 0
+
+        games = calculator.calculate_score()
+        with calculator.metrics.stage("publish"):
+            nba.print_scoring_csv(games, date_str, calculator.playoff_mode,
+                                  nba.NBARankingStore(league.ranking_store_file), league.scoring_dir)
+        return len(games)
+    finally:
+        calculator.write_metrics(f"{league.scoring_dir}/metrics-{date_str}")
+
+
+if __name__ == "__main__":
+    _ = load_dotenv(find_dotenv(filename='./.env'))
+    parser = argparse.ArgumentParser(description="Calculate rankings of many leagues")
+    parser.add_argument("--leagues", nargs="+", choices=list(nba.LEAGUES),
+                        default=[league.strip() for league in os.getenv("LEAGUES", "nba").split(",")],
+                        help="leagues to rank")
+    parser.add_argument("--date", type=datetime.date.fromisoformat,
+                        help="date in ET (yyyy-mm-dd), yesterday by default")
+    args = parser.parse_args()
+
+    unknown = [league for league in args.leagues if league not in nba.LEAGUES]
+    if unknown:
+        parser.error(f"unknown leagues in LEAGUES: {', '.join(unknown)}")
+    date = args.date or datetime.date.today() - datetime.timedelta(days=1)
+
+    # All workers share the same rate limiter and response cache
+    collector = nba.NBAGamesDataCollector()
+    rate_limiter, response_cache = collector.rate_limiter, collector.response_cache
+
+    failed = False
+    with ThreadPoolExecutor(max_workers=len(args.leagues)) as pool:
+        jobs = {league: pool.submit(rank_league, nba.LEAGUES[league], date, rate_limiter, response_cache)
+                for league in args.leagues}
+        # a league that failed (e.g. its API calls did not fit in the quota) does not stop the others
+        for league, job in jobs.items():
+            try:
+                no_of_games = job.result()
+            except (nba.APIQuotaExceeded, nba.APIRequestFailed) as e:
+                print(f"{nba.LEAGUES[league].name}: {e}. The ranking of {date} was not published.")
+                failed = True
+                continue
+            print(f"{nba.LEAGUES[league].name}: {no_of_games} games ranked on {date}")
+
+    if failed:
+        exit(1)
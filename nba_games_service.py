@@ -0,0 +1,193 @@
+"""
+nba_games_service.py
+
+Small read-only HTTP/JSON service over the ranking store, for our bot, dashboard and the tweet job, so they do not
+have to parse CSV files.
+
+Latest rankings of all dates are loaded into memory and indexed by date, team and GameId, so requests never touch
+the disk. Every response has an ETag; a client sending it back in If-None-Match gets 304 Not Modified without
+a body. The service checks the store every few seconds and reloads the indexes in the background when a new
+scoring run lands, so there is no need to restart it.
+
+Endpoints (all GET, all JSON):
+    /rankings/yyyy-mm-dd                        ranking for a date
+    /teams/<team id or name>/top?season=&n=     team's top games of a season (the current one by default)
+    /top?start=yyyy-mm-dd&end=yyyy-mm-dd&n=     top n games of a range of dates
+    /games/<GameId>                             a single game
+    /health                                     version (id of the latest run) and size of the indexes
+
+Usage:
+    python nba_games_service.py --port 8080
+    python nba_games_service.py --playoff
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl, unquote
+import nbagames as nba
+
+RELOAD_INTERVAL = 5  # seconds between checks of the store for new runs
+TOP_N = 10  # default number of games in top lists
+MAX_CACHED_RESPONSES = 10000  # any query string is a new URL, so the cache of responses is bounded
+
+
+# Latest rankings of all dates in memory. An index is never modified after it is built - a reload builds a new one
+# and swaps it in - so requests can read it without locks
+class RankingIndex:
+    FIELDS = ['date', 'position', 'game_id', 'start_time_et', 'visitor', 'host', 'v_team_id', 'h_team_id',
+              'v_logo', 'h_logo', 'score', 'degraded']
+
+    def __init__(self, store: nba.NBARankingStore, playoff_mode=False):
+        self.version = store.last_run_id()
+        rankings = store.latest_all(playoff_mode=playoff_mode)
+        self.by_date = {}  # date -> games ordered by position
+        self.by_team = {}  # team id and lower case name -> games
+        self.by_game = {}  # GameId -> game
+        for values in rankings[self.FIELDS].itertuples(index=False, name=None):
+            game = {field: (value.item() if hasattr(value, 'item') else value)
+                    for field, value in zip(self.FIELDS, values)}
+            self.by_date.setdefault(game['date'], []).append(game)
+            self.by_game[game['game_id']] = game
+            keys = {str(game['v_team_id']), str(game['h_team_id']), game['visitor'].lower(), game['host'].lower()}
+            for key in keys - {'None', ''}:
+                self.by_team.setdefault(key, []).append(game)
+        self.dates = sorted(self.by_date)
+
+    # games of dates from start to end (inclusive). Dates are sorted, so we only walk over the range
+    def games_between(self, start, end):
+        for date in self.dates:
+            if date > end:
+                break
+            if date >= start:
+                yield from self.by_date[date]
+
+    @staticmethod
+    def top(games, n):
+        return sorted(games, key=lambda game: (-game['score'], game['date'], game['position']))[:n]
+
+
+# Answers requests from the current index. Responses are cached per URL until the index is reloaded
+class RankingService:
+    def __init__(self, store: nba.NBARankingStore, playoff_mode=False, reload_interval=RELOAD_INTERVAL):
+        self.store = store
+        self.playoff_mode = playoff_mode
+        self.reload_interval = reload_interval
+        self.index = RankingIndex(store, playoff_mode)
+        self.responses = {}  # URL -> (status, body, etag) for the current index
+        self.lock = threading.Lock()
+
+    # reloads the index if there is a new run in the store. Returns True if reloaded
+    def reload(self):
+        if self.store.last_run_id() == self.index.version:
+            return False
+        index = RankingIndex(self.store, self.playoff_mode)
+        with self.lock:
+            self.index, self.responses = index, {}
+        return True
+
+    def watch(self):
+        while True:
+            time.sleep(self.reload_interval)
+            try:
+                if self.reload():
+                    print(f"Rankings reloaded, version {self.index.version}")
+            except Exception as e:  # the store may be locked or replaced for a moment - we try again later
+                print(f"Unable to reload rankings: {e}")
+
+    # returns (status, body, etag) for a request URL. The ETag depends on the body only, so a response that did not
+    # change in a new run (e.g. the ranking of another date) keeps its ETag and clients still get 304
+    def respond(self, url):
+        with self.lock:
+            index, responses = self.index, self.responses
+        response = responses.get(url)
+        if response is None:
+            status, data = self.route(index, url)
+            body = json.dumps(data, separators=(',', ':')).encode("utf-8")
+            etag = f'"{hashlib.sha1(body).hexdigest()[:16]}"'
+            if len(responses) >= MAX_CACHED_RESPONSES:
+                responses.clear()
+            response = responses[url] = (status, body, etag)
+        return response
+
+    def route(self, index: RankingIndex, url):
+        url = urlsplit(url)
+        # parts are unquoted, e.g. /teams/Los%20Angeles%20Lakers/top
+        parts = [unquote(part) for part in url.path.split("/") if part]
+        params = dict(parse_qsl(url.query))
+        try:
+            n = int(params.get("n", TOP_N))
+        except ValueError:
+            return 400, {"error": "n must be a number"}
+        if n < 0:
+            return 400, {"error": "n must not be negative"}
+
+        if parts == ["health"]:
+            return 200, {"version": index.version, "dates": len(index.dates), "games": len(index.by_game)}
+        if len(parts) == 2 and parts[0] == "rankings":
+            if parts[1] not in index.by_date:
+                return 404, {"error": f"No ranking for {parts[1]}"}
+            return 200, {"date": parts[1], "games": index.by_date[parts[1]]}
+        if len(parts) == 2 and parts[0] == "games":
+            if parts[1] not in index.by_game:
+                return 404, {"error": f"No game {parts[1]}"}
+            return 200, index.by_game[parts[1]]
+        if len(parts) == 3 and parts[0] == "teams" and parts[2] == "top":
+            team = parts[1].lower()
+            if team not in index.by_team:
+                return 404, {"error": f"No games of team {parts[1]}"}
+            try:
+                season = int(params.get("season", nba.season_of(datetime.date.today())))
+            except ValueError:
+                return 400, {"error": "season must be a year"}
+            start, end = f"{season}-08-01", f"{season + 1}-07-31"  # see season_of
+            games = [game for game in index.by_team[team] if start <= game['date'] <= end]
+            return 200, {"team": parts[1], "season": season, "games": index.top(games, n)}
+        if parts == ["top"]:
+            start, end = params.get("start", "0000-00-00"), params.get("end", "9999-99-99")
+            return 200, {"start": start, "end": end, "games": index.top(index.games_between(start, end), n)}
+        return 404, {"error": "Unknown endpoint"}
+
+
+def handler(service: RankingService):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, body, etag = service.respond(self.path)
+            if status == 200 and etag in [tag.strip() for tag in self.headers.get("If-None-Match", "").split(",")]:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", etag)
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="HTTP/JSON service over the ranking store")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8080, help="port to listen on")
+    parser.add_argument("--playoff", action="store_true", help="rankings with playoff scoring")
+    args = parser.parse_args()
+
+    service = RankingService(nba.NBARankingStore(nba.RANKING_STORE_FILE), args.playoff)
+    threading.Thread(target=service.watch, daemon=True).start()
+    server = ThreadingHTTPServer((args.host, args.port), handler(service))
+    print(f"Serving {len(service.index.by_game)} games from {len(service.index.dates)} dates "
+          f"on http://{args.host}:{args.port}")
+    server.serve_forever()
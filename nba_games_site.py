@@ -0,0 +1,212 @@
+"""
+nba_games_site.py
+
+Builds a static HTML site from rankings in the ranking store (./scoring/rankings.sqlite):
+- index.html: the season - every date with its number of games and the best game,
+- days/yyyy-mm-dd.html: the ranking of a date,
+- teams/<team id>.html: games of a team in the season, starting from the best one.
+
+Pages are rendered from templates compiled once (string.Template) in a single pass over the rows of the season.
+The build is incremental: manifest.json in the site directory remembers which run of the store every date was
+built from and a hash of every file written. Only pages of dates with a new run (and pages of teams that played
+on these dates, and the index) are rendered again, and only files whose content changed are written.
+
+Usage:
+    python nba_games_site.py                       # the current season
+    python nba_games_site.py --season 2024 --out ./site-2024
+    python nba_games_site.py --force               # render all pages again
+
+Author: Szymon Manduk
+"""
+
+import argparse
+import datetime
+import hashlib
+import html
+import json
+import os
+from string import Template
+import nbagames as nba
+
+SITE_DIR = "./site"
+MANIFEST_FILE = "manifest.json"
+
+PAGE = Template("""<!DOCTYPE html>
+<html>
+  <head>
+    <meta charset="utf-8">
+    <title>$title</title>
+    <link rel="stylesheet" type="text/css" href="${root}style.css"/>
+  </head>
+  <body>
+    <nav><a href="${root}index.html">NBA Games Ranked $season_name</a></nav>
+    <h1>$title</h1>
+$content
+  </body>
+</html>
+""")
+TABLE = Template("""    <table class="greenTable"><thead><tr>$header</tr></thead><tbody>
+$rows
+    </tbody></table>""")
+INDEX_ROW = Template('      <tr><td><a href="days/$date.html">$date</a></td><td>$games</td>'
+                     '<td>$best_game</td><td>$best_score</td></tr>')
+DAY_ROW = Template('      <tr><td>$position</td><td>$start_time_et</td>'
+                   '<td><img src="$v_logo" alt="" height="24"/> <a href="../teams/$v_team.html">$visitor</a></td>'
+                   '<td><img src="$h_logo" alt="" height="24"/> <a href="../teams/$h_team.html">$host</a></td>'
+                   '<td>$score</td></tr>')
+TEAM_ROW = Template('      <tr><td><a href="../days/$date.html">$date</a></td><td>$visitor</td><td>$host</td>'
+                    '<td>$score</td></tr>')
+TEAM_LINK = Template('<a href="teams/$team.html">$name</a>')
+STYLE = """table.greenTable { border: 2px solid #24943A; background-color: #D4EED1; text-align: left;
+  border-collapse: collapse; }
+table.greenTable td, table.greenTable th { border: 1px solid #24943A; padding: 3px 6px; }
+table.greenTable thead { background: #24943A; color: #F0F0F0; }
+"""
+
+
+def th(*columns):
+    return "".join(f"<th>{column}</th>" for column in columns)
+
+
+# team key used in file names: team id if we have it, otherwise the name
+def team_key(team_id, name):
+    if team_id:
+        return str(team_id)
+    return "".join(c for c in name if c.isalnum())
+
+
+# Pages of a season, rendered from its rankings (NBARankingStore.latest_all). Rows are grouped by date and team
+# in a single pass
+class SeasonPages:
+    def __init__(self, season, rankings):
+        self.season = season
+        self.season_name = f"{season}-{season + 1}"
+        self.days = {}  # date -> rows of the ranking
+        self.teams = {}  # team key -> rows of games of the team
+        self.team_names = {}  # team key -> the latest short name of the team
+        for row in rankings.itertuples(index=False):
+            v_team, h_team = team_key(row.v_team_id, row.visitor), team_key(row.h_team_id, row.host)
+            self.days.setdefault(row.date, []).append(row)
+            self.teams.setdefault(v_team, []).append(row)
+            self.teams.setdefault(h_team, []).append(row)
+            self.team_names[v_team], self.team_names[h_team] = row.visitor, row.host
+
+    def page(self, title, content, root=""):
+        return PAGE.substitute(title=html.escape(title), content=content, root=root,
+                               season_name=self.season_name)
+
+    def index(self):
+        rows = "\n".join(INDEX_ROW.substitute(
+            date=date, games=len(ranking),
+            best_game=html.escape(f"{ranking[0].visitor} - {ranking[0].host}"), best_score=ranking[0].score
+        ) for date, ranking in sorted(self.days.items(), reverse=True))
+        teams = ", ".join(TEAM_LINK.substitute(team=team, name=html.escape(name))
+                          for team, name in sorted(self.team_names.items(), key=lambda item: item[1]))
+        content = TABLE.substitute(header=th("Date", "Games", "Best game", "Score"), rows=rows)
+        return self.page(f"Season {self.season_name}", content + f"\n    <p>Teams: {teams}</p>")
+
+    def day(self, date):
+        rows = "\n".join(DAY_ROW.substitute(
+            position=row.position + 1, start_time_et=html.escape(str(row.start_time_et or "")),
+            v_logo=html.escape(str(row.v_logo or "")), h_logo=html.escape(str(row.h_logo or "")),
+            v_team=team_key(row.v_team_id, row.visitor), h_team=team_key(row.h_team_id, row.host),
+            visitor=html.escape(row.visitor), host=html.escape(row.host), score=row.score
+        ) for row in self.days[date])
+        content = TABLE.substitute(header=th("#", "Start Time ET", "Visitor", "Host", "SCORE: 0 - 100"), rows=rows)
+        return self.page(f"Games of {date}", content, root="../")
+
+    def team(self, team):
+        games = sorted(self.teams[team], key=lambda row: (-row.score, row.date))
+        rows = "\n".join(TEAM_ROW.substitute(
+            date=row.date, visitor=html.escape(row.visitor), host=html.escape(row.host), score=row.score
+        ) for row in games)
+        content = TABLE.substitute(header=th("Date", "Visitor", "Host", "SCORE: 0 - 100"), rows=rows)
+        return self.page(f"{self.team_names[team]} {self.season_name}", content, root="../")
+
+
+# Files of the site with the manifest: run ids the dates were built from and hashes of files we wrote
+class Site:
+    def __init__(self, directory):
+        self.directory = directory
+        try:
+            with open(os.path.join(directory, MANIFEST_FILE), "r") as f:
+                self.manifest = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+        self.manifest.setdefault('dates', {})
+        self.manifest.setdefault('files', {})
+        self.written = 0
+
+    # writes a file only if its content changed (or the file is missing). Returns True if written
+    def write(self, path, content):
+        digest = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        file_name = os.path.join(self.directory, path)
+        if self.manifest['files'].get(path) == digest and os.path.exists(file_name):
+            return False
+
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_file_name, file_name)
+        self.manifest['files'][path] = digest
+        self.written += 1
+        return True
+
+    def save(self):
+        file_name = os.path.join(self.directory, MANIFEST_FILE)
+        with open(file_name + ".tmp", "w") as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+        os.replace(file_name + ".tmp", file_name)
+
+
+# Builds (or updates) the site of a season. Returns number of files written
+def build_site(store: nba.NBARankingStore, season, directory=SITE_DIR, playoff_mode=False, force=False):
+    # season_of: a season lasts from August till July
+    start, end = f"{season}-08-01", f"{season + 1}-07-31"
+    site = Site(directory)
+    if site.manifest.get('season', season) != season or site.manifest.get('playoff', playoff_mode) != playoff_mode:
+        force = True  # the directory holds another season
+
+    latest_runs = store.latest_runs(start, end, playoff_mode)
+    changed = sorted(date for date, run_id in latest_runs.items()
+                     if force or site.manifest['dates'].get(date) != run_id)
+    if not changed:
+        return 0
+
+    pages = SeasonPages(season, store.latest_all(start, end, playoff_mode))
+    # pages of teams that play in the new rankings of changed dates, and of teams that played in the old ones
+    # (a team may have dropped out of a ranking)
+    teams = set()
+    day_teams = site.manifest.setdefault('day_teams', {})
+    for date in changed:
+        site.write(f"days/{date}.html", pages.day(date))
+        teams.update(day_teams.get(date, []))
+        day_teams[date] = sorted({team_key(row.v_team_id, row.visitor) for row in pages.days[date]} |
+                                 {team_key(row.h_team_id, row.host) for row in pages.days[date]})
+        teams.update(day_teams[date])
+    for team in sorted(teams):
+        if team in pages.teams:
+            site.write(f"teams/{team}.html", pages.team(team))
+        elif site.manifest['files'].pop(f"teams/{team}.html", None) is not None:
+            os.remove(os.path.join(directory, f"teams/{team}.html"))
+    site.write("index.html", pages.index())
+    site.write("style.css", STYLE)
+
+    site.manifest['season'], site.manifest['playoff'] = season, playoff_mode
+    site.manifest['dates'] = {date: latest_runs[date] for date in sorted(latest_runs)}
+    site.save()
+    return site.written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the static site of a season from the ranking store")
+    parser.add_argument("--season", type=int, default=nba.season_of(datetime.date.today()),
+                        help="season as the year it starts in, e.g. 2024 for 2024-2025")
+    parser.add_argument("--out", default=SITE_DIR, help="directory of the site")
+    parser.add_argument("--playoff", action="store_true", help="rankings with playoff scoring")
+    parser.add_argument("--force", action="store_true", help="render all pages again")
+    args = parser.parse_args()
+
+    written = build_site(nba.NBARankingStore(nba.RANKING_STORE_FILE), args.season, args.out, args.playoff, args.force)
+    print(f"{written} files written to {args.out}")
@@ -9,32 +9,1428 @@ Author: Szymon Manduk
 
 import datetime
 import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 import requests
+import numpy as np
 import pandas as pd
 import json
 import os
+import random
+import math
+import hashlib
+import contextlib
+import codecs
+import html
+import re
+import sqlite3
+import zlib
+import fcntl
+from dataclasses import dataclass, asdict
+from pandas.api.types import union_categoricals
 from dotenv import load_dotenv, find_dotenv
 
+
+# Raised when data we cannot do without (e.g. the schedule of games) could not be collected from the API
+class APIRequestFailed(Exception):
+    pass
+
+
+# Raised when the daily quota of an API host is used up. Waiting would not help here - the quota resets
+# once a day - so instead of blocking for hours we stop the run
+class APIQuotaExceeded(Exception):
+    pass
+
+
+# Limits of a single API host. We keep times of calls of the last minute, so no 60 seconds ever have more than
+# calls_per_minute calls (a token bucket that starts full lets almost twice as many through in the first minute).
+# A run may burst up to calls_per_minute calls and only waits when the window is full.
+# The daily quota is a simple counter that resets every 24 hours (or when the API tells us so). It is not kept
+# between runs: a new process assumes the whole daily quota until the first response brings the remaining quota
+# (x-ratelimit-requests-remaining), so calls planned before that may count on more than is actually left.
+class CallWindow:
+    WINDOW = 60  # seconds
+
+    def __init__(self, calls_per_minute, calls_per_day, clock=time.monotonic):
+        self.clock = clock
+        self.calls_per_minute = calls_per_minute
+        self.calls = deque()  # times of calls in the last WINDOW seconds, the oldest first
+        self.updated_at = clock()
+        self.calls_per_day = calls_per_day
+        self.day_remaining = calls_per_day
+        self.day_reset_at = self.updated_at + 24 * 60 * 60
+        self.blocked_until = 0  # set when the API responds with 429 Too Many Requests
+
+    def refresh(self):
+        now = self.clock()
+        while self.calls and self.calls[0] <= now - self.WINDOW:
+            self.calls.popleft()
+        self.updated_at = now
+        if now >= self.day_reset_at:
+            self.day_remaining = self.calls_per_day
+            self.day_reset_at = now + 24 * 60 * 60
+
+    # number of calls we can make right now
+    def free(self):
+        return self.calls_per_minute - len(self.calls)
+
+    # counts calls as made now, e.g. when the API tells us we have fewer calls left in this minute than we think
+    def fill(self, no_of_calls):
+        self.calls.extend([self.updated_at] * max(0, no_of_calls))
+
+    # takes a call if available. Returns 0 on success or number of seconds to wait before trying again
+    def try_take(self):
+        self.refresh()
+        if self.day_remaining <= 0:
+            raise APIQuotaExceeded(f"Daily quota of {self.calls_per_day} calls used up")
+        wait = self.blocked_until - self.updated_at
+        if wait > 0:
+            return wait
+        if self.free() <= 0:
+            return self.calls[0] + self.WINDOW - self.updated_at
+        self.calls.append(self.updated_at)
+        self.day_remaining -= 1
+        return 0
+
+
+# Rate limiter with separate windows of calls (see CallWindow) for each API host, as api-nba and api-basketball
+# have separate quotas.
+# Limits are given per host as (calls per minute, calls per day). acquire() blocks only if the budget of the host
+# is actually used up. update() adjusts the windows to rate limit headers sent back by RapidAPI.
+class APIRateLimiter:
+    def __init__(self, limits, clock=time.monotonic, sleep=time.sleep):
+        self.clock = clock
+        self.sleep = sleep
+        self.lock = threading.Lock()
+        self.windows = {host: CallWindow(per_minute, per_day, clock) for host, (per_minute, per_day) in limits.items()}
+
+    # returns number of seconds we had to wait
+    def acquire(self, host):
+        waited = 0
+        while True:
+            with self.lock:
+                wait = self.windows[host].try_take()
+            if wait <= 0:
+                return waited
+            self.sleep(wait)
+            waited += wait
+
+    # RapidAPI sends the remaining daily (or monthly) quota in x-ratelimit-requests-* headers, api-sports sends
+    # the per-minute limit in x-ratelimit-* headers. After 429 we respect retry-after, if present.
+    def update(self, host, headers, status_code=200):
+        headers = {k.lower(): v for k, v in headers.items()}
+        with self.lock:
+            window = self.windows[host]
+            window.refresh()
+            try:
+                if 'x-ratelimit-requests-remaining' in headers:
+                    window.day_remaining = int(headers['x-ratelimit-requests-remaining'])
+                if 'x-ratelimit-requests-reset' in headers:
+                    window.day_reset_at = window.updated_at + int(headers['x-ratelimit-requests-reset'])
+                if 'x-ratelimit-remaining' in headers:
+                    window.fill(window.free() - int(float(headers['x-ratelimit-remaining'])))
+                if status_code == 429:
+                    window.fill(window.free())
+                    window.blocked_until = window.updated_at + float(headers.get('retry-after', 60))
+            except ValueError:
+                pass  # malformed header - we keep our own accounting
+
+    # number of calls left today for a host
+    def remaining(self, host):
+        with self.lock:
+            window = self.windows[host]
+            window.refresh()
+            return window.day_remaining
+
+# Metrics of a run: where the time goes and how the API behaves. APIClient records every request (latency
+# histogram, bytes, JSON decoding time, status), retries, failures, cache hits and time spent waiting for the rate
+# limiter, collectors record timings of their stages and events worth alerting on. At the end of a run metrics are
+# written as a Prometheus textfile (for node_exporter's textfile collector) and as a JSON summary.
+# A single RunMetrics may be shared by many collectors and threads.
+class RunMetrics:
+    LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, math.inf)  # seconds
+    PREFIX = "nbagames"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.started_at = time.time()
+        self.endpoints = {}  # endpoint -> counters and latency histogram
+        self.hosts = {}  # host -> rate limiter waits and remaining quota
+        self.stages = {}  # stage -> seconds
+        self.events = {}  # event -> count
+
+    # URL without the base and with ids, dates and seasons replaced, e.g. /statistics/players/gameId/{id}
+    @staticmethod
+    def endpoint(url):
+        path = url.split("://", 1)[-1].partition("/")[2]
+        return "/" + "/".join("{id}" if any(c.isdigit() for c in part) else part for part in path.split("/"))
+
+    def endpoint_metrics(self, endpoint):
+        if endpoint not in self.endpoints:
+            self.endpoints[endpoint] = {
+                'requests': {}, 'bytes': 0, 'decode_seconds': 0.0, 'retries': 0, 'failures': 0,
+                'cache_hits': 0, 'cache_misses': 0,
+                'latency_buckets': [0] * len(self.LATENCY_BUCKETS), 'latency_sum': 0.0, 'latency_max': 0.0,
+            }
+        return self.endpoints[endpoint]
+
+    def host_metrics(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = {'waits': 0, 'wait_seconds': 0.0, 'quota_remaining': None}
+        return self.hosts[host]
+
+    # status is the HTTP status code or the name of the exception if there was no response
+    def observe_request(self, endpoint, seconds, size, status):
+        with self.lock:
+            metrics = self.endpoint_metrics(endpoint)
+            metrics['requests'][str(status)] = metrics['requests'].get(str(status), 0) + 1
+            metrics['bytes'] += size
+            metrics['latency_sum'] += seconds
+            metrics['latency_max'] = max(metrics['latency_max'], seconds)
+            for i, bucket in enumerate(self.LATENCY_BUCKETS):
+                if seconds <= bucket:
+                    metrics['latency_buckets'][i] += 1
+                    break
+
+    def observe_decode(self, endpoint, seconds):
+        with self.lock:
+            self.endpoint_metrics(endpoint)['decode_seconds'] += seconds
+
+    def observe_wait(self, host, seconds):
+        if seconds <= 0:
+            return
+        with self.lock:
+            metrics = self.host_metrics(host)
+            metrics['waits'] += 1
+            metrics['wait_seconds'] += seconds
+
+    # name: 'retries', 'failures', 'cache_hits' or 'cache_misses'
+    def count_request(self, endpoint, name):
+        with self.lock:
+            self.endpoint_metrics(endpoint)[name] += 1
+
+    def count(self, event):
+        with self.lock:
+            self.events[event] = self.events.get(event, 0) + 1
+
+    def set_quota(self, host, remaining):
+        with self.lock:
+            self.host_metrics(host)['quota_remaining'] = remaining
+
+    # measures a stage of the run: with metrics.stage("collect"): ...
+    # Stages run more than once (e.g. in a backfill) are summed up
+    @contextlib.contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage(name, time.perf_counter() - start)
+
+    def add_stage(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def summary(self):
+        with self.lock:
+            endpoints = {}
+            for endpoint, metrics in sorted(self.endpoints.items()):
+                requests = sum(metrics['requests'].values())
+                endpoints[endpoint] = dict(
+                    metrics,
+                    requests_total=requests,
+                    latency_avg=metrics['latency_sum'] / requests if requests else None,
+                    latency_buckets=dict(zip([str(b) for b in self.LATENCY_BUCKETS], metrics['latency_buckets'])),
+                )
+            return {
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'stages': dict(self.stages),
+                'events': dict(self.events),
+                'hosts': {host: dict(metrics) for host, metrics in sorted(self.hosts.items())},
+                'endpoints': endpoints,
+            }
+
+    # metrics in the Prometheus text exposition format
+    def prometheus(self):
+        summary = self.summary()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP {self.PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {self.PREFIX}_{name} {kind}")
+            for labels, value in samples:
+                labels = ",".join(f'{k}="{v}"' for k, v in labels.items())
+                value = "+Inf" if value == math.inf else repr(float(value))
+                lines.append(f"{self.PREFIX}_{name}{{{labels}}} {value}" if labels else f"{self.PREFIX}_{name} {value}")
+
+        endpoints = summary['endpoints']
+        buckets = []
+        for endpoint, metrics in endpoints.items():
+            cumulative = 0
+            for bucket, count in zip(self.LATENCY_BUCKETS, metrics['latency_buckets'].values()):
+                cumulative += count
+                le = "+Inf" if bucket == math.inf else str(bucket)
+                buckets.append(({'endpoint': endpoint, 'le': le}, cumulative))
+        lines.append(f"# HELP {self.PREFIX}_api_request_duration_seconds Latency of API requests")
+        lines.append(f"# TYPE {self.PREFIX}_api_request_duration_seconds histogram")
+        for labels, value in buckets:
+            lines.append(f'{self.PREFIX}_api_request_duration_seconds_bucket'
+                         f'{{endpoint="{labels["endpoint"]}",le="{labels["le"]}"}} {value}')
+        for endpoint, metrics in endpoints.items():
+            lines.append(f'{self.PREFIX}_api_request_duration_seconds_sum{{endpoint="{endpoint}"}} '
+                         f'{metrics["latency_sum"]!r}')
+            lines.append(f'{self.PREFIX}_api_request_duration_seconds_count{{endpoint="{endpoint}"}} '
+                         f'{metrics["requests_total"]}')
+
+        metric("api_requests_total", "counter", "API requests by endpoint and HTTP status",
+               [({'endpoint': e, 'status': status}, n)
+                for e, m in endpoints.items() for status, n in m['requests'].items()])
+        metric("api_response_bytes_total", "counter", "Bytes received from the API",
+               [({'endpoint': e}, m['bytes']) for e, m in endpoints.items()])
+        metric("api_decode_seconds_total", "counter", "Time spent decoding JSON responses",
+               [({'endpoint': e}, m['decode_seconds']) for e, m in endpoints.items()])
+        metric("api_retries_total", "counter", "Retried API requests",
+               [({'endpoint': e}, m['retries']) for e, m in endpoints.items()])
+        metric("api_failures_total", "counter", "API calls that failed after all retries",
+               [({'endpoint': e}, m['failures']) for e, m in endpoints.items()])
+        metric("api_cache_requests_total", "counter", "API calls served from the response cache (hit) or not (miss)",
+               [({'endpoint': e, 'result': result}, m[name]) for e, m in endpoints.items()
+                for result, name in (('hit', 'cache_hits'), ('miss', 'cache_misses'))])
+        metric("rate_limit_waits_total", "counter", "Times we had to wait for the rate limiter",
+               [({'host': h}, m['waits']) for h, m in summary['hosts'].items()])
+        metric("rate_limit_wait_seconds_total", "counter", "Time spent waiting for the rate limiter",
+               [({'host': h}, m['wait_seconds']) for h, m in summary['hosts'].items()])
+        metric("api_quota_remaining", "gauge", "API calls left in the daily quota",
+               [({'host': h}, m['quota_remaining']) for h, m in summary['hosts'].items()
+                if m['quota_remaining'] is not None])
+        metric("stage_duration_seconds", "gauge", "Duration of stages of the run",
+               [({'stage': stage}, seconds) for stage, seconds in summary['stages'].items()])
+        metric("events_total", "counter", "Events worth alerting on, e.g. data we were unable to get",
+               [({'event': event}, n) for event, n in summary['events'].items()])
+        metric("run_duration_seconds", "gauge", "Duration of the run", [({}, summary['duration_seconds'])])
+        metric("run_timestamp_seconds", "gauge", "When the run started", [({}, summary['started_at'])])
+        return "\n".join(lines) + "\n"
+
+    # writes file_prefix.prom and file_prefix.json. Both are replaced atomically, as the textfile collector
+    # may read them at any time
+    def write(self, file_prefix):
+        os.makedirs(os.path.dirname(file_prefix) or ".", exist_ok=True)
+        for extension, content in ((".prom", self.prometheus()),
+                                   (".json", json.dumps(self.summary(), indent=1, default=str))):
+            tmp_file_name = file_prefix + extension + ".tmp"
+            with open(tmp_file_name, "w") as f:
+                f.write(content)
+            os.replace(tmp_file_name, file_prefix + extension)
+
+
+# Result of an API call. We need to tell apart:
+# - 'ok': the API returned data,
+# - 'no data': the API responded correctly, but there is nothing for our query (e.g. no games on a date),
+# - 'failed': we did not get a valid response, even after retries. error describes why.
+@dataclass
+class APIResult:
+    status: str
+    data: dict = None
+    error: str = None
+    status_code: int = None
+
+    @property
+    def ok(self):
+        return self.status == 'ok'
+
+    @property
+    def failed(self):
+        return self.status == 'failed'
+
+
+# On-disk cache of API responses, so data we already have is not downloaded again by the next run.
+# Entries are content-addressed: the file name is a hash of the URL and query parameters. Every entry has its own
+# time to live: data of finished games never changes, so it is kept forever (ttl = math.inf), data of games that
+# are not finished yet is kept for a short time only.
+# In replay-only mode we never go to the network: everything is served from recorded responses, regardless of age.
+class ResponseCache:
+    SHORT_TTL = 10 * 60  # seconds, for data that may still change
+
+    def __init__(self, directory, replay_only=False, clock=time.time):
+        self.directory = directory
+        self.replay_only = replay_only
+        self.clock = clock
+
+    @staticmethod
+    def key(url, params=None):
+        canonical = url + "?" + json.dumps(params or {}, sort_keys=True)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[0:2], key + ".json")
+
+    # returns cached data or None if there is no entry, or it has expired
+    def get(self, url, params=None):
+        try:
+            with open(self.path(self.key(url, params)), "r") as f:
+                entry = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+        if entry['expires_at'] is not None and entry['expires_at'] < self.clock() and not self.replay_only:
+            return None
+        return entry['data']
+
+    def put(self, url, params, data, ttl):
+        if ttl <= 0:
+            return
+        path = self.path(self.key(url, params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        entry = {
+            'url': url,
+            'params': params,
+            'fetched_at': self.clock(),
+            'expires_at': None if ttl == math.inf else self.clock() + ttl,
+            'data': data,
+        }
+        # we write to a temporary file and rename it, so concurrent readers never see a partially written entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry, f, separators=(',', ':'))
+        os.replace(tmp_path, path)
+
+
+# Compressed record of a single response in NBAPayloadArchive: a JSON header (url, params, fetched_at) and the raw
+# body. The body may be written in chunks, as it is downloaded
+class ArchiveRecord:
+    def __init__(self, url, params, fetched_at):
+        self.fetched_at = fetched_at
+        # a small window and memory level: a few records are compressed at the same time and responses are small,
+        # so the default (about 256 KB of state per record) would cost more memory than the responses themselves
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 13, 6)
+        header = json.dumps({'url': url, 'params': params, 'fetched_at': fetched_at}, separators=(',', ':'))
+        self.parts = [self.compressor.compress(header.encode("utf-8") + b"\n")]
+
+    def write(self, chunk):
+        self.parts.append(self.compressor.compress(chunk))
+
+    def close(self):
+        self.parts.append(self.compressor.flush())
+        return b"".join(self.parts)
+
+
+# Archive of raw API responses (schedule, standings, box scores, api-basketball) for audits and offline re-scoring.
+# Responses are compressed one by one (zlib) and appended to segment files; a new segment is started when the current
+# one reaches SEGMENT_SIZE. Every response gets a fixed-size entry in a sidecar index (kind, date, GameId, segment,
+# offset, length), which is read through a memory map, so finding the responses of a game does not read the
+# segments and reading one decompresses only that response. Appends are serialised with a lock on the index file,
+# so more processes (e.g. the daily run and a backfill) can write to the same archive
+class NBAPayloadArchive:
+    KINDS = {'schedule': 1, 'standings': 2, 'box_score': 3, 'api_basketball': 4}
+    INDEX_DTYPE = np.dtype([
+        ('date', '<i4'),  # yyyymmdd, 0 if not known
+        ('game_id', '<i8'),  # 0 if the response is not about a single game
+        ('kind', 'u1'),
+        ('segment', '<u2'),
+        ('offset', '<u8'),
+        ('length', '<u4'),
+        ('fetched_at', '<f8'),
+    ])
+    INDEX_FILE = "index.bin"
+    SEGMENT_SIZE = 256 * 1024 * 1024  # bytes
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.lock = threading.Lock()
+
+    def record(self, url, params=None):
+        return ArchiveRecord(url, params, time.time())
+
+    def segment_file(self, segment):
+        return os.path.join(self.directory, f"segment-{segment:05d}.z")
+
+    @staticmethod
+    def date_key(date):
+        return int(str(date).replace("-", "")) if date else 0
+
+    # appends a closed record of a response of a kind (see KINDS). date is the date the response is about
+    def append(self, kind, date, game_id, record: ArchiveRecord):
+        data = record.close()
+        os.makedirs(self.directory, exist_ok=True)
+        with self.lock, open(os.path.join(self.directory, self.INDEX_FILE), "a+b") as index:
+            fcntl.flock(index, fcntl.LOCK_EX)
+            size = index.seek(0, os.SEEK_END)
+            # an incomplete entry left by an interrupted append is cut off, its response is not indexed
+            size -= size % self.INDEX_DTYPE.itemsize
+            index.truncate(size)
+
+            segment = 1
+            if size > 0:
+                index.seek(size - self.INDEX_DTYPE.itemsize)
+                segment = int(np.frombuffer(index.read(self.INDEX_DTYPE.itemsize), self.INDEX_DTYPE)['segment'][0])
+            try:
+                segment_size = os.path.getsize(self.segment_file(segment))
+            except FileNotFoundError:
+                segment_size = 0
+            if segment_size > 0 and segment_size + len(data) > self.SEGMENT_SIZE:
+                segment += 1
+            with open(self.segment_file(segment), "ab") as f:
+                offset = f.tell()
+                f.write(data)
+
+            entry = np.array([(self.date_key(date), to_int(game_id), self.KINDS[kind], segment, offset, len(data),
+                               record.fetched_at)], dtype=self.INDEX_DTYPE)
+            index.write(entry.tobytes())
+
+    # all index entries, memory mapped (read-only)
+    def entries(self):
+        file_name = os.path.join(self.directory, self.INDEX_FILE)
+        try:
+            count = os.path.getsize(file_name) // self.INDEX_DTYPE.itemsize
+        except FileNotFoundError:
+            count = 0
+        if count == 0:
+            return np.zeros(0, dtype=self.INDEX_DTYPE)
+        return np.memmap(file_name, dtype=self.INDEX_DTYPE, mode="r", shape=(count,))
+
+    # index entries of responses of a kind, date (yyyy-mm-dd) and/or GameId, in the order they were archived
+    def find(self, kind=None, date=None, game_id=None):
+        entries = self.entries()
+        match = np.ones(len(entries), dtype=bool)
+        if kind is not None:
+            match &= entries['kind'] == self.KINDS[kind]
+        if date is not None:
+            match &= entries['date'] == self.date_key(date)
+        if game_id is not None:
+            match &= entries['game_id'] == to_int(game_id)
+        return entries[match]
+
+    # header (url, params, fetched_at) and raw body of an archived response
+    def read(self, entry):
+        with open(self.segment_file(int(entry['segment'])), "rb") as f:
+            f.seek(int(entry['offset']))
+            header, body = zlib.decompress(f.read(int(entry['length']))).split(b"\n", 1)
+        return json.loads(header), body
+
+    # the latest archived response of a kind (for a date and/or game), decoded, or None if there is none
+    def latest(self, kind, date=None, game_id=None):
+        entries = self.find(kind, date, game_id)
+        if len(entries) == 0:
+            return None
+        return json.loads(self.read(entries[-1])[1])
+
+
+# HTTP client used for all API calls. It keeps one pooled keep-alive session per host (so we do not open a new
+# connection and TLS handshake for every call), uses connect/read timeouts and retries failed calls with jittered
+# exponential backoff. All our calls are GETs, hence safe to retry. Every attempt takes a token from the rate limiter.
+# If a ResponseCache is given, responses are served from it when possible and stored in it as the caller's ttl
+# function decides (ttl is a function of the returned data, so e.g. a schedule with all games finished is kept forever).
+class APIClient:
+    TIMEOUT = (5, 30)  # seconds: (connect, read)
+    RETRIES = 3  # additional attempts after the first one
+    BACKOFF = 1  # seconds, the base of exponential backoff
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+    CHUNK_SIZE = 16 * 1024  # bytes, when a response is decoded while it is downloaded (see get)
+
+    # by default backoff sleeps with the same function as the rate limiter (so a virtual clock can replace both)
+    # Requests, retries, cache hits and rate limiter waits are recorded in metrics (see RunMetrics)
+    def __init__(self, rate_limiter, pool_size=4, timeout=TIMEOUT, retries=RETRIES, sleep=None, cache=None,
+                 metrics=None, archive=None):
+        self.rate_limiter = rate_limiter
+        self.cache = cache
+        self.archive = archive
+        self.metrics = metrics or RunMetrics()
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.sleep = sleep or rate_limiter.sleep
+        self.sessions = {}  # host -> requests.Session
+        self.lock = threading.Lock()
+
+    def session(self, host):
+        with self.lock:
+            if host not in self.sessions:
+                session = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    # ttl: function that takes the returned data and gives the number of seconds it may be cached for.
+    # None means the response is not cached at all. fresh=True skips the cache lookup (the response is still
+    # cached), e.g. when we poll for data that changes often.
+    # decode is a function that gets the body as an iterator of chunks of bytes and returns the data, so a large
+    # response can be reduced to what we need while it is downloaded (see extract_box_score). By default the whole
+    # body is decoded as JSON.
+    # archive_as = (kind, date, GameId) puts the raw body of the response into the archive (see NBAPayloadArchive),
+    # if the client has one. Responses served from the cache are not archived again
+    def get(self, url, headers, params=None, ttl=None, fresh=False, decode=None, archive_as=None):
+        endpoint = self.metrics.endpoint(url)
+        if self.cache is not None and ((ttl is not None and not fresh) or self.cache.replay_only):
+            data = self.cache.get(url, params)
+            if data is not None:
+                self.metrics.count_request(endpoint, 'cache_hits')
+                return self.classify(data)
+            self.metrics.count_request(endpoint, 'cache_misses')
+            if self.cache.replay_only:
+                self.metrics.count_request(endpoint, 'failures')
+                return APIResult('failed', error=f"No recorded response for {url} {params or ''}")
+
+        host = headers.get('x-rapidapi-host') or headers.get('X-RapidAPI-Host')
+        result = None
+        for attempt in range(self.retries + 1):
+            if attempt > 0:
+                # full jitter: somewhere between 0 and BACKOFF * 2^attempt seconds
+                self.metrics.count_request(endpoint, 'retries')
+                self.sleep(random.uniform(0, self.BACKOFF * 2 ** attempt))
+
+            result, retry = self.attempt(host, url, headers, params, endpoint, decode, archive_as)
+            if not retry:
+                break
+
+        if result.failed:
+            self.metrics.count_request(endpoint, 'failures')
+        # we never cache failures
+        if self.cache is not None and ttl is not None and not result.failed:
+            self.cache.put(url, params, result.data, ttl(result.data))
+        return result
+
+    # a single attempt. Returns APIResult and whether it makes sense to try again
+    def attempt(self, host, url, headers, params, endpoint=None, decode=None, archive_as=None):
+        endpoint = endpoint or self.metrics.endpoint(url)
+        self.metrics.observe_wait(host, self.rate_limiter.acquire(host))
+        start = time.perf_counter()
+        try:
+            response = self.session(host).get(url, headers=headers, params=params, timeout=self.timeout,
+                                              stream=decode is not None)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            self.metrics.observe_request(endpoint, time.perf_counter() - start, 0, type(e).__name__)
+            return APIResult('failed', error=f"{type(e).__name__}: {e}"), True
+        except requests.RequestException as e:
+            self.metrics.observe_request(endpoint, time.perf_counter() - start, 0, type(e).__name__)
+            return APIResult('failed', error=f"{type(e).__name__}: {e}"), False
+        self.rate_limiter.update(host, response.headers, response.status_code)
+        if decode is None or response.status_code != 200:
+            self.metrics.observe_request(endpoint, time.perf_counter() - start, len(response.content),
+                                         response.status_code)
+        if response.status_code != 200:
+            return (APIResult('failed', error=f"HTTP {response.status_code}", status_code=response.status_code),
+                    response.status_code in self.RETRY_STATUS_CODES)
+
+        decode_start = time.perf_counter()
+        received = 0
+        record = self.archive.record(url, params) if self.archive is not None and archive_as is not None else None
+
+        def chunks():
+            nonlocal received
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                received += len(chunk)
+                if record is not None:
+                    record.write(chunk)
+                yield chunk
+
+        try:
+            if decode is None:
+                data = response.json()
+                if record is not None:
+                    record.write(response.content)
+            else:
+                body = chunks()
+                data = decode(body)
+                if record is not None:
+                    for _ in body:  # the archive gets the whole body, even if decoding stopped before its end
+                        pass
+        except ValueError:  # truncated or otherwise malformed body
+            return APIResult('failed', error="Failed to decode JSON response", status_code=200), True
+        except requests.RequestException as e:  # the connection broke while a streamed body was downloaded
+            return APIResult('failed', error=f"{type(e).__name__}: {e}"), True
+        finally:
+            self.metrics.observe_decode(endpoint, time.perf_counter() - decode_start)
+            # a streamed body is downloaded while it is decoded, so the request lasts until decoding is done
+            if decode is not None:
+                response.close()  # decoding may stop before the end of a streamed body
+                self.metrics.observe_request(endpoint, time.perf_counter() - start, received, response.status_code)
+
+        if record is not None:
+            try:
+                self.archive.append(*archive_as, record)
+            except OSError as e:  # the archive is for audits - the run goes on without it
+                print(f"Unable to archive response of {url}: {e}")
+                self.metrics.count("archive_failed")
+
+        result = self.classify(data)
+        result.status_code = 200
+        return result, False
+
+    # telling apart valid data, no data and errors reported in the body of a response
+    @staticmethod
+    def classify(data):
+        # api-basketball reports errors (e.g. wrong parameters) with HTTP 200 and a non-empty 'errors' field
+        if isinstance(data, dict) and data.get('errors'):
+            return APIResult('failed', data=data, error=f"API errors: {data['errors']}")
+
+        # api-nba wraps everything in 'api', api-basketball does not. Both report number of results
+        results = data.get('api', data).get('results') if isinstance(data, dict) else None
+        if results is not None and int(results) == 0:
+            return APIResult('no data', data=data)
+        return APIResult('ok', data=data)
+
+
+# this function converts a value from the API (numbers are often sent as strings) into int, default if not possible
+def to_int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+# this function yields elements of the array under key in a JSON document, given as an iterator of chunks of bytes.
+# Elements are decoded one at a time as soon as they are downloaded, so memory holds a single element and a chunk
+# of the body, not the whole document. The first array under key (at any depth) is used and everything after it is
+# not read. Raises KeyError if there is no such array and ValueError if the document ends inside of it
+def iter_json_array(chunks, key):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    array_start = re.compile(r'"' + re.escape(key) + r'"\s*:\s*\[')
+    buffer, position, in_array = "", 0, False
+    for chunk in chunks:
+        buffer = buffer[position:] + utf8.decode(chunk)
+        position = 0
+        if not in_array:
+            match = array_start.search(buffer)
+            if match is None:
+                # the key may be cut in half by the end of the chunk - we keep its beginning
+                buffer = buffer[max(buffer.rfind('"', 0, buffer.rfind('"')), 0):]
+                continue
+            position, in_array = match.end(), True
+
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if buffer[position] == "]":
+                return
+            try:
+                element, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # the element is not complete yet - we wait for the next chunk
+            yield element
+
+    if in_array:
+        raise ValueError(f"JSON document ended inside of the '{key}' array")
+    raise KeyError(key)
+
+
+# Features of a game from its box score (api-nba /statistics/players/gameId/), one compact record instead of
+# the statistics of all players. Players are added one by one, as they are decoded (see extract_box_score)
+@dataclass(slots=True)
+class BoxScoreFeatures:
+    players: int = 0
+    highest_pts: int = 0  # the highest number of points scored by a player
+    pts_40: int = 0  # number of players who scored 40 points or more
+    double_doubles: int = 0
+    triple_doubles: int = 0
+
+    # categories of double-doubles and triple-doubles
+    CATEGORIES = ('points', 'totReb', 'assists', 'steals', 'blocks')
+
+    def add(self, player):
+        points = int(player['points'])
+        self.players += 1
+        self.highest_pts = max(self.highest_pts, points)
+        self.pts_40 += points >= 40
+        doubles = sum(to_int(player.get(category)) >= 10 for category in self.CATEGORIES)
+        self.double_doubles += doubles >= 2
+        self.triple_doubles += doubles >= 3
+
+    @classmethod
+    def from_players(cls, players):
+        features = cls()
+        for player in players:
+            features.add(player)
+        return features
+
+
+# Decoder of box score responses for APIClient.get: statistics of players are streamed from the body and reduced
+# to BoxScoreFeatures in a single pass. Returns the record (which is also what gets cached) as
+# {'results': number of players, 'box_score': features}. If the body has no statistics or they are not what we
+# expect, the record is {'error': reason}
+def extract_box_score(chunks):
+    features = BoxScoreFeatures()
+    try:
+        for player in iter_json_array(chunks, 'statistics'):
+            try:
+                features.add(player)
+            except (KeyError, TypeError, ValueError, AttributeError) as e:
+                return {'error': f"Unexpected statistics of a player: {type(e).__name__}: {e}"}
+    except KeyError:
+        return {'error': "No statistics in the response"}
+    return {'results': features.players, 'box_score': asdict(features)}
+
+
+# Game from the schedule (api-nba /games/date/), decoded once from the JSON payload
+@dataclass(slots=True)
+class ScheduledGame:
+    game_id: str
+    status: str
+    start_time_utc: str  # as returned by the API, e.g. 2019-12-04T02:09:00.000Z
+    end_time_utc: str
+    current_period: str  # e.g. 5/4 - the game ended in the 5th period, so there was 1 OT
+    v_team_id: str
+    v_short_name: str
+    v_full_name: str
+    v_logo: str
+    v_points: int
+    h_team_id: str
+    h_short_name: str
+    h_full_name: str
+    h_logo: str
+    h_points: int
+
+    # returns None if the entry is broken - sometimes, due to error in a response, there is an empty element
+    # in data['api']['games']
+    @classmethod
+    def from_api(cls, game):
+        v_team = game.get('vTeam') or {}
+        h_team = game.get('hTeam') or {}
+        if not v_team.get('teamId') or not h_team.get('teamId'):
+            return None
+        return cls(
+            game_id=str(game['gameId']),
+            status=game['statusGame'],
+            start_time_utc=game['startTimeUTC'],
+            end_time_utc=game.get('endTimeUTC', ''),
+            current_period=str(game.get('currentPeriod', '')),
+            v_team_id=str(v_team['teamId']),
+            v_short_name=v_team['shortName'],
+            v_full_name=v_team['fullName'],
+            v_logo=v_team.get('logo', ''),
+            v_points=to_int(v_team.get('score', {}).get('points')),
+            h_team_id=str(h_team['teamId']),
+            h_short_name=h_team['shortName'],
+            h_full_name=h_team['fullName'],
+            h_logo=h_team.get('logo', ''),
+            h_points=to_int(h_team.get('score', {}).get('points')),
+        )
+
+    # number of OTs: currentPeriod is e.g. 5/4 for a game that ended in the 5th period
+    @property
+    def no_OT(self):
+        return to_int(self.current_period[0:1], 4) - 4
+
+
+# A game from api-basketball in the shape of a game from api-nba (see ScheduledGame.from_api), for leagues api-nba
+# does not cover. api-basketball has no end times and tells only whether there was an OT, not how many
+def api_basketball_game(game):
+    status = (game.get('status') or {}).get('short')
+    teams = game.get('teams') or {}
+    scores = game.get('scores') or {}
+    try:
+        start_time_utc = datetime.datetime.fromisoformat(game['date']).astimezone(datetime.timezone.utc)\
+            .strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    except (KeyError, TypeError, ValueError):
+        start_time_utc = ''
+
+    def team(side):
+        team = teams.get(side) or {}
+        return {'teamId': team.get('id'), 'shortName': team.get('name'), 'fullName': team.get('name'),
+                'logo': team.get('logo') or '', 'score': {'points': (scores.get(side) or {}).get('total')}}
+
+    return {
+        'gameId': game.get('id'),
+        # FT - finished, AOT - finished after over time
+        'statusGame': 'Finished' if status in ('FT', 'AOT') else (game.get('status') or {}).get('long'),
+        'startTimeUTC': start_time_utc,
+        'currentPeriod': "5/4" if (scores.get('home') or {}).get('over_time') is not None else "4/4",
+        'vTeam': team('away'),
+        'hTeam': team('home'),
+    }
+
+
+# Conference rank and win PCT of a team
+@dataclass(slots=True)
+class TeamStanding:
+    rank: int
+    pct: float
+
+
+# A game with all data needed for scoring - a row of games_df
+@dataclass(slots=True)
+class GameRecord:
+    status: str
+    start_time_utc: str
+    start_time_et: str
+    start_time_et_date: str
+    start_time_cet: str
+    end_time_utc: str
+    end_time_et: str
+    end_time_cet: str
+    v_team_id: str
+    v_pct: float
+    v_conf_rank: int
+    visitor: str
+    visitor_pts: int
+    host_pts: int
+    host: str
+    h_conf_rank: int
+    h_pct: float
+    h_team_id: str
+    points_diff: int
+    no_OT: int
+    no_OT2: int
+    v_logo_link: str
+    h_logo_link: str
+    playoff: int  # PLAYOFF2021
+    game_id: str
+    highest_pts: float  # NaN if we were unable to get it
+    pts_40: float  # box score features (see BoxScoreFeatures), NaN if we do not have them
+    double_doubles: float
+    triple_doubles: float
+    degraded: str  # data the game was scored without, e.g. 'highest_pts,OT', '' if none (see plan_box_scores)
+
+
+# Columns of games_df: (column name, GameRecord field, dtype)
+GAMES_DF_COLUMNS = [
+    ('Status', 'status', 'object'),
+    ('Start Time UTC', 'start_time_utc', 'object'),
+    ('Start Time ET', 'start_time_et', 'object'),
+    ('Start Time ET Date', 'start_time_et_date', 'object'),
+    ('Start Time CET', 'start_time_cet', 'object'),
+    ('End Time UTC', 'end_time_utc', 'object'),
+    ('End Time ET', 'end_time_et', 'object'),
+    ('End Time CET', 'end_time_cet', 'object'),
+    ('vTeamID', 'v_team_id', 'object'),
+    ('vPCT', 'v_pct', 'float64'),
+    ('vConfRank', 'v_conf_rank', 'int64'),
+    ('Visitor', 'visitor', 'object'),
+    ('Visitor Pts', 'visitor_pts', 'int64'),
+    ('Host Pts', 'host_pts', 'int64'),
+    ('Host', 'host', 'object'),
+    ('hConfRank', 'h_conf_rank', 'int64'),
+    ('hPCT', 'h_pct', 'float64'),
+    ('hTeamID', 'h_team_id', 'object'),
+    ('pointsDiff', 'points_diff', 'int64'),
+    ('OT', 'no_OT', 'int64'),
+    ('OT2', 'no_OT2', 'int64'),
+    ('vLogoLink', 'v_logo_link', 'object'),
+    ('hLogoLink', 'h_logo_link', 'object'),
+    ('Playoff', 'playoff', 'int64'),  # PLAYOFF2021
+    ('GameId', 'game_id', 'object'),
+    ('Highest pts', 'highest_pts', 'float64'),
+    ('40 pts', 'pts_40', 'float64'),
+    ('Double doubles', 'double_doubles', 'float64'),
+    ('Triple doubles', 'triple_doubles', 'float64'),
+    ('Degraded', 'degraded', 'object'),
+]
+
+
+# this function converts game records into games DataFrame in one step, column by column with explicit dtypes
+def games_to_df(records):
+    return pd.DataFrame({
+        column: pd.Series([getattr(record, field) for record in records], dtype=dtype)
+        for column, field, dtype in GAMES_DF_COLUMNS
+    })
+
+
+# Compact layout of games DataFrames, for keeping many days or seasons of games in one process (e.g. results
+# of a backfill). Statuses, team names, logo URLs and flags are categoricals (every distinct value is stored once and
+# rows keep small integer codes), team ids and counts are narrow integers and times are datetime64 (wall time in the
+# time zone of the column). Column names stay the same, so compact frames can be filtered and scored like games_df.
+# Columns: name -> how the column is stored (see compact_games). Columns that are not here are kept as they are
+COMPACT_GAMES_COLUMNS = {
+    'Date': 'date',
+    'Status': 'category',
+    'Start Time UTC': 'time',
+    'Start Time ET': 'time',
+    'Start Time ET Date': 'date',
+    'Start Time CET': 'time',
+    'End Time UTC': 'time',
+    'End Time ET': 'time',
+    'End Time CET': 'time',
+    'vTeamID': 'int16',
+    'vPCT': 'float64',
+    'vConfRank': 'int8',
+    'Visitor': 'team',
+    'Visitor Pts': 'int16',
+    'Host Pts': 'int16',
+    'Host': 'team',
+    'hConfRank': 'int8',
+    'hPCT': 'float64',
+    'hTeamID': 'int16',
+    'pointsDiff': 'int16',
+    'OT': 'int8',
+    'OT2': 'int8',
+    'vLogoLink': 'logo',
+    'hLogoLink': 'logo',
+    'Playoff': 'int8',  # PLAYOFF2021
+    'GameId': 'id',
+    'Highest pts': 'float32',
+    '40 pts': 'float32',
+    'Double doubles': 'float32',
+    'Triple doubles': 'float32',
+    'Degraded': 'category',
+    'SCORE: 0 - 100': 'int8',
+}
+# visitor and host columns of a kind share their categories, so a team (or a logo) is stored once
+COMPACT_GAMES_PAIRS = {'team': ('Visitor', 'Host'), 'logo': ('vLogoLink', 'hLogoLink')}
+
+
+def categorical(values, categories):
+    return pd.Categorical(values.astype('object').where(values.notna(), None), categories=categories)
+
+
+# this function converts a games DataFrame (as built by games_to_df, or read from a CSV file as strings) into
+# the compact layout. Already compact frames are returned unchanged
+def compact_games(games):
+    columns = {}
+    for column in games.columns:
+        kind = COMPACT_GAMES_COLUMNS.get(column)
+        values = games[column]
+        if kind in ('time', 'date'):
+            fmt = TIME_FORMAT if kind == 'time' else DATE_FORMAT
+            columns[column] = values if values.dtype.kind == 'M' else pd.to_datetime(values, format=fmt,
+                                                                                      errors='coerce')
+        elif kind in ('category', 'team', 'logo'):
+            pair = COMPACT_GAMES_PAIRS.get(kind, (column,))
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                columns[column] = values
+                continue
+            categories = sorted({value for name in pair if name in games.columns
+                                 for value in games[name].dropna().unique()})
+            columns[column] = categorical(values, categories)
+        elif kind == 'id':
+            # GameIds are numbers sent as strings. If any of them is not, they stay strings
+            numbers = pd.to_numeric(values, errors='coerce')
+            columns[column] = numbers.astype('Int64') if numbers.notna().sum() == values.notna().sum() else values
+        elif kind is not None:
+            numbers = pd.to_numeric(values, errors='coerce')
+            if kind.startswith('int') and numbers.isna().any():
+                kind = kind.capitalize()  # nullable integers, e.g. Int16, where a value is missing
+            columns[column] = numbers.astype(kind)
+        else:
+            columns[column] = values
+    return pd.DataFrame(columns, index=games.index)
+
+
+# this function converts a compact games DataFrame back into text columns as in games_df (e.g. to write a CSV file
+# that looks like the ones written before)
+def expand_games(games):
+    columns = {}
+    for column in games.columns:
+        kind = COMPACT_GAMES_COLUMNS.get(column)
+        values = games[column]
+        if kind in ('time', 'date') and values.dtype.kind == 'M':
+            fmt = TIME_FORMAT if kind == 'time' else DATE_FORMAT
+            columns[column] = values.dt.strftime(fmt).astype('object').where(values.notna(), None)
+        elif kind == 'id' or isinstance(values.dtype, pd.CategoricalDtype):
+            columns[column] = values.astype('object').where(values.notna(), None).map(
+                lambda value: value if value is None else str(value))
+        else:
+            columns[column] = values
+    return pd.DataFrame(columns, index=games.index)
+
+
+# Concatenation of compact frames (e.g. days of a season) in a single step: every column is built once from
+# the columns of all frames. Categoricals are merged with union_categoricals - pd.concat would turn categoricals
+# with different categories into object columns
+def concat_games(frames):
+    frames = [frame for frame in frames if len(frame) > 0]
+    if not frames:
+        return pd.DataFrame()
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if isinstance(parts[0].dtype, pd.CategoricalDtype):
+            columns[column] = union_categoricals(parts, ignore_order=True)
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+# Collects games of many days (or seasons) in the compact layout and concatenates them once, when frame() is
+# called, instead of copying everything collected so far for every new day (pd.concat in a loop).
+# Days are kept as they are until they add up to block_size rows; then they are concatenated and converted
+# (compact_games) as one block, so the conversion runs once per block and not for every small frame
+class GamesAccumulator:
+    def __init__(self, block_size=10000):
+        self.block_size = block_size
+        self.blocks = []  # compact frames
+        self.chunks = []  # frames not converted yet
+        self.chunk_rows = 0
+
+    def add(self, games):
+        if len(games) == 0:
+            return
+        self.chunks.append(games)
+        self.chunk_rows += len(games)
+        if self.chunk_rows >= self.block_size:
+            self.flush()
+
+    def flush(self):
+        if self.chunks:
+            block = self.chunks[0] if len(self.chunks) == 1 else pd.concat(self.chunks, ignore_index=True)
+            self.blocks.append(compact_games(block))
+            self.chunks, self.chunk_rows = [], 0
+
+    def frame(self):
+        self.flush()
+        return concat_games(self.blocks)
+
+
+# this function reads a CSV file of games (e.g. results of a backfill) in chunks of chunk_size rows into
+# the compact layout, so the text of the whole file is never held in memory at once
+def read_games_csv(file_name, chunk_size=50000):
+    games = GamesAccumulator()
+    for chunk in pd.read_csv(file_name, dtype=str, chunksize=chunk_size):
+        games.add(chunk)
+    return games.frame()
+
+
+# Overtimes of games from api-basketball, indexed once per schedule by (ET date, home team, visiting team),
+# so a game is found with a dictionary lookup instead of a scan of the whole list for every game.
+# Team names differ a bit between both APIs, so they are normalised (e.g. "LA Clippers" and "Los Angeles Clippers").
+# api-basketball reports points scored in all OTs together, not the number of OT periods, so for a game that went
+# to OT we can only tell there was at least 1 OT. If the feed is missing (games is None), every lookup returns 0.
+class OvertimeIndex:
+    TEAM_NAME_ALIASES = {
+        'laclippers': 'losangelesclippers',
+        'lalakers': 'losangeleslakers',
+    }
+
+    def __init__(self, games=None):
+        self.available = games is not None
+        self.games = {}  # (ET date, home, visitor) -> number of OTs
+        self.home_games = {}  # (ET date, home) -> number of OTs, in case the visiting team name does not match
+        eastern = pytz.timezone(TIME_ZONE_ET)
+
+        for game in games or []:
+            try:
+                et_date = datetime.datetime.fromisoformat(game['date']).astimezone(eastern).strftime('%Y-%m-%d')
+                home = self.normalise(game['teams']['home']['name'])
+                visitor = self.normalise(game['teams']['away']['name'])
+            except (KeyError, TypeError, ValueError):
+                continue  # broken entry, we cannot tell which game it is
+            over_time = ((game.get('scores') or {}).get('home') or {}).get('over_time')
+            no_OT = 1 if over_time is not None else 0
+
+            self.games[(et_date, home, visitor)] = no_OT
+            self.home_games[(et_date, home)] = no_OT
+
+    @classmethod
+    def normalise(cls, name):
+        name = "".join(c for c in str(name).lower() if c.isalnum())
+        return cls.TEAM_NAME_ALIASES.get(name, name)
+
+    def lookup(self, et_date, home_team_name, visitor_team_name=None):
+        home = self.normalise(home_team_name)
+        if visitor_team_name is not None:
+            no_OT = self.games.get((et_date, home, self.normalise(visitor_team_name)))
+            if no_OT is not None:
+                return no_OT
+        return self.home_games.get((et_date, home), 0)
+
+
+# Time zones we present times in: UTC as returned by the API, ET for the USA and CET for Poland
+TIME_ZONE_ET = 'US/Eastern'
+TIME_ZONE_CET = 'Europe/Warsaw'
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+DATE_FORMAT = '%Y-%m-%d'
+
+
+# this function converts datetimes returned from the API as strings into tz-aware (UTC) datetime64 column, all at once.
+# Date format is usually '%Y-%m-%dT%H:%M:%S.%fZ'. However sometimes it's only '%Y-%m-%d', hence values that cannot
+# be converted from a full format are converted from a date only. Values that fail both are NaT
+def parse_api_times(values):
+    values = pd.Series(values, dtype='object')
+    full = pd.to_datetime(values, format='%Y-%m-%dT%H:%M:%S.%fZ', errors='coerce', utc=True)
+    date_only = pd.to_datetime(values, format=DATE_FORMAT, errors='coerce', utc=True)
+    return full.where(full.notna(), date_only)
+
+
+# Columnar version of get_formatted_dates: converts all API datetimes of a payload at once and returns a DataFrame
+# with tz-aware datetime columns 'utc', 'et', 'cet', 'et_day' (datetime64 date in ET, for filtering by ET date)
+# and formatted strings 'utc_str', 'et_str', 'et_date_str', 'cet_str' (None where the value could not be converted)
+def format_api_times(values):
+    utc = parse_api_times(values)
+    et = utc.dt.tz_convert(TIME_ZONE_ET)
+    cet = utc.dt.tz_convert(TIME_ZONE_CET)
+    valid = utc.notna()
+
+    def to_str(times, fmt):
+        return times.dt.strftime(fmt).astype('object').where(valid, None)
+
+    return pd.DataFrame({
+        'utc': utc,
+        'et': et,
+        'cet': cet,
+        'et_day': et.dt.tz_localize(None).dt.normalize(),
+        'utc_str': to_str(utc, TIME_FORMAT),
+        'et_str': to_str(et, TIME_FORMAT),
+        'et_date_str': to_str(et, DATE_FORMAT),
+        'cet_str': to_str(cet, TIME_FORMAT),
+    })
+
+
+# Standings of the whole league indexed by teamId, so rank and win PCT of a team are a dictionary lookup.
+# The table is downloaded once per run (instead of 2 calls per game) and persisted to a JSON file together
+# with the time it was fetched. Runs that start within ttl seconds from that time reuse the file.
+class NBAStandingsStore:
+    def __init__(self, file_name, ttl):
+        self.file_name = file_name
+        self.ttl = ttl  # seconds
+        self.fetched_at = None  # unix timestamp of the API call the table comes from
+        self.teams = {}  # teamId -> TeamStanding
+
+    # standings are fresh if they were fetched less than ttl seconds ago
+    def is_fresh(self):
+        return self.fetched_at is not None and time.time() - self.fetched_at < self.ttl
+
+    # reading standings from the file. Returns True if standings were found and are still fresh.
+    # Expired standings are not loaded at all - teams missing in the table are looked up with the API,
+    # instead of being scored on old ranks
+    def load(self):
+        try:
+            with open(self.file_name, "r") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return False
+
+        if data['fetched_at'] is None or time.time() - data['fetched_at'] >= self.ttl:
+            return False
+        self.fetched_at = data['fetched_at']
+        self.teams = {team_id: TeamStanding(**team) for team_id, team in data['teams'].items()}
+        return True
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.file_name) or ".", exist_ok=True)
+        teams = {team_id: asdict(team) for team_id, team in self.teams.items()}
+        # the file may be read by other collectors at the same time (e.g. workers of a backfill), so it is
+        # written to a temporary file and renamed into place
+        tmp_file_name = self.file_name + ".tmp"
+        with open(tmp_file_name, "w") as f:
+            json.dump({'fetched_at': self.fetched_at, 'teams': teams}, f)
+        os.replace(tmp_file_name, self.file_name)
+
+    # building the index from the 'standings' list returned by the API
+    def update(self, standings):
+        self.teams = {}
+        self.add(standings)
+        self.fetched_at = time.time()
+
+    # adding (or replacing) entries for single teams, e.g. from the per-team endpoint
+    def add(self, standings):
+        for team in standings:
+            self.teams[str(team['teamId'])] = TeamStanding(
+                rank=int(team['conference']['rank']),
+                pct=float(team['winPercentage']),
+            )
+
+    # entries of api-basketball standings (a list of groups, e.g. conferences and the whole league) in the shape of
+    # the 'standings' list of api-nba. A team is ranked in the smallest group it is in, i.e. in its conference
+    @staticmethod
+    def from_api_basketball(groups):
+        standings = {}
+        for group in sorted(groups, key=len):
+            for team in group:
+                team_id = str(team['team']['id'])
+                if team_id not in standings:
+                    standings[team_id] = {'teamId': team_id, 'conference': {'rank': team['position']},
+                                          'winPercentage': team['games']['win']['percentage']}
+        return list(standings.values())
+
+    # returns (conference rank, win PCT) of a team or None if the team is not in the table
+    def get(self, team_id):
+        team = self.teams.get(str(team_id))
+        if team is None:
+            return None
+        return team.rank, team.pct
+
+
+# Per-game state kept between runs, keyed by GameId. For every game we keep what we collected about it from
+# other endpoints (standings of both teams, the highest pts, OTs from api-basketball), its score and a fingerprint
+# of the game in the schedule. As long as the fingerprint does not change, later runs reuse the stored data
+# instead of calling the API again.
+class NBAGamesStateStore:
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.games = {}  # GameId -> entry
+        self.lock = threading.RLock()  # the store may be shared by collectors working in parallel
+        self.load()
+
+    # status, score and number of periods - if any of these changes, the game has to be enriched again
+    @staticmethod
+    def fingerprint(game: ScheduledGame):
+        return "|".join([game.status, str(game.v_points), str(game.h_points), game.current_period])
+
+    def load(self):
+        with self.lock:
+            try:
+                with open(self.file_name, "r") as f:
+                    self.games = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                self.games = {}
+
+    def save(self):
+        with self.lock:
+            os.makedirs(os.path.dirname(self.file_name) or ".", exist_ok=True)
+            tmp_file_name = self.file_name + ".tmp"
+            with open(tmp_file_name, "w") as f:
+                json.dump(self.games, f)
+            os.replace(tmp_file_name, self.file_name)
+
+    # returns the stored entry of a game from the schedule, or None if the game is new or changed since then
+    def get(self, game: ScheduledGame):
+        with self.lock:
+            entry = self.games.get(game.game_id)
+        if entry is None or entry['fingerprint'] != self.fingerprint(game):
+            return None
+        return entry
+
+    def put(self, game: ScheduledGame, entry):
+        entry['fingerprint'] = self.fingerprint(game)
+        with self.lock:
+            self.games[game.game_id] = entry
+
+    def set_score(self, game_id, score):
+        with self.lock:
+            if str(game_id) in self.games:
+                self.games[str(game_id)]['score'] = score
+
+
+# A league we rank. The NBA is collected from api-nba (schedule, standings, box scores) with OTs from api-basketball.
+# Other leagues covered by api-basketball are collected from api-basketball alone: schedule with OTs and standings,
+# there are no box scores, so their games are scored without the highest pts
+@dataclass(frozen=True)
+class League:
+    key: str  # used in names of files, e.g. wnba
+    name: str
+    api_basketball_id: int  # 'league' parameter of api-basketball
+    api_nba: bool = False
+    calendar_seasons: bool = False  # a season within a calendar year (e.g. WNBA "2025"), not "2025-2026"
+
+    # the season a date belongs to, as the year it starts in (see season_of)
+    def season_of(self, date: datetime.date):
+        return date.year if self.calendar_seasons else season_of(date)
+
+    # 'season' parameter of api-basketball
+    def api_basketball_season(self, season):
+        return str(season) if self.calendar_seasons else f"{season}-{season + 1}"
+
+    # Files of the NBA keep the names they had before other leagues were added, e.g. ./cache/games-state.json,
+    # other leagues have the key added, e.g. ./cache/games-state-wnba.json
+    def file_name(self, file_name):
+        if self.key == 'nba':
+            return file_name
+        base, extension = os.path.splitext(file_name)
+        return f"{base}-{self.key}{extension}"
+
+    # rankings, CSV files, ready markers and metrics of the league
+    @property
+    def scoring_dir(self):
+        return "./scoring" if self.key == 'nba' else f"./scoring/{self.key}"
+
+    @property
+    def ranking_store_file(self):
+        return self.scoring_dir + "/rankings.sqlite"
+
+
+# Leagues we can rank. Leagues ranked every night are set in .env file, e.g. LEAGUES=nba,wnba
+# (see nba_games_leagues.py). Ids are the ones of api-basketball
+LEAGUES = {
+    'nba': League('nba', "NBA", 12, api_nba=True),
+    'wnba': League('wnba', "WNBA", 13, calendar_seasons=True),
+    'gleague': League('gleague', "NBA G League", 20),
+}
+
+
 # Class collects games data from external api provided by RapidAPI
 class NBAGamesDataCollector:
-    # We need to pause between API calls to avoid exceeding the limit of 10 calls per minute
-    API_PAUSE_TIME = 8  # seconds
-
-    def __init__(self, playoff_mode=False):  # if playoff mode we include additional scoring # PLAYOFF2021
+    # API limits of our RapidAPI plans per host: (calls per minute, calls per day)
+    # Can be changed in .env file, e.g. API_NBA_CALLS_PER_MINUTE=10 or API_BASKETBALL_CALLS_PER_DAY=100
+    API_NBA_HOST = "api-nba-v1.p.rapidapi.com"
+    API_BASKETBALL_HOST = "api-basketball.p.rapidapi.com"
+    # Base URLs of the APIs. Can be changed in .env file (API_NBA_URL, API_BASKETBALL_URL), e.g. to point
+    # at a local stand-in server (see bench_nbagames.py). Rate limits are still kept per host above
+    API_NBA_URL = "https://" + API_NBA_HOST
+    API_BASKETBALL_URL = "https://" + API_BASKETBALL_HOST
+    API_LIMITS = {
+        API_NBA_HOST: (10, 100),
+        API_BASKETBALL_HOST: (10, 100),
+    }
+    # number of API calls that can be in flight at the same time. The rate limiter still decides when they go out
+    API_WORKERS = 4
+
+    # Standings of the whole league are cached on disk and reused for that long. Can be set in .env file
+    STANDINGS_TTL = 6 * 60 * 60  # seconds
+
+    # What we know about games from earlier runs (see NBAGamesStateStore)
+    GAMES_STATE_FILE = './cache/games-state.json'
+
+    # Responses of the API are cached in this directory. API_REPLAY=1 in .env serves everything from the cache
+    RESPONSE_CACHE_DIR = './cache/responses'
+
+    # Raw responses are archived in this directory (see NBAPayloadArchive). Can be changed in .env file
+    # (API_ARCHIVE_DIR), API_ARCHIVE=0 turns archiving off
+    ARCHIVE_DIR = './archive'
+
+    # rate_limiter, response_cache and games_state may be shared by many collectors working in the same process.
+    # league is one of LEAGUES, the NBA by default. season is the season we collect data for, as the year it starts
+    # in (2025 is season 2025-2026), by default the current season of the league
+    def __init__(self, playoff_mode=False, rate_limiter=None, response_cache=None, games_state=None,
+                 season=None, metrics=None, league=None):  # playoff mode adds scoring # PLAYOFF2021
         # read API key from .env file
         _ = load_dotenv(find_dotenv(filename='./.env'))
         self.API_KEY= os.getenv("API_KEY")
        
         self.HEADERS = {
-            'x-rapidapi-host': "api-nba-v1.p.rapidapi.com",
+            'x-rapidapi-host': self.API_NBA_HOST,
             'x-rapidapi-key': self.API_KEY
         }
+        if rate_limiter is None:
+            rate_limiter = APIRateLimiter({
+                self.API_NBA_HOST: (
+                    int(os.getenv("API_NBA_CALLS_PER_MINUTE", self.API_LIMITS[self.API_NBA_HOST][0])),
+                    int(os.getenv("API_NBA_CALLS_PER_DAY", self.API_LIMITS[self.API_NBA_HOST][1])),
+                ),
+                self.API_BASKETBALL_HOST: (
+                    int(os.getenv("API_BASKETBALL_CALLS_PER_MINUTE", self.API_LIMITS[self.API_BASKETBALL_HOST][0])),
+                    int(os.getenv("API_BASKETBALL_CALLS_PER_DAY", self.API_LIMITS[self.API_BASKETBALL_HOST][1])),
+                ),
+            })
+        self.rate_limiter = rate_limiter
+        if response_cache is None:
+            response_cache = ResponseCache(
+                os.getenv("API_CACHE_DIR", self.RESPONSE_CACHE_DIR),
+                replay_only=(os.getenv("API_REPLAY", "0") == "1")
+            )
+        self.response_cache = response_cache
+        self.metrics = metrics or RunMetrics()  # may be shared too
+        self.league = league or LEAGUES['nba']
+        if season is None:
+            season = self.league.season_of(datetime.date.today())
+        # every league has its own archive (e.g. ./archive-wnba), as the index does not tell leagues apart
+        self.archive = None
+        if os.getenv("API_ARCHIVE", "1") == "1":
+            self.archive = NBAPayloadArchive(self.league.file_name(os.getenv("API_ARCHIVE_DIR", self.ARCHIVE_DIR)))
+        self.api = APIClient(rate_limiter, pool_size=self.API_WORKERS, cache=response_cache, metrics=self.metrics,
+                             archive=self.archive)
+        self.standings_unavailable = False  # set when we were unable to get standings of the whole league
         self.request_games = None
         self.request_team = None
-        self.url_games = "https://api-nba-v1.p.rapidapi.com/games/date/"
-        self.url_team = "https://api-nba-v1.p.rapidapi.com/standings/standard/2025/teamId/"
-        self.url_stats = "https://api-nba-v1.p.rapidapi.com/statistics/players/gameId/"
+        self.url_api_nba = os.getenv("API_NBA_URL", self.API_NBA_URL)
+        self.url_games = f"{self.url_api_nba}/games/date/"
+        self.season = season
+        self.url_team = f"{self.url_api_nba}/standings/standard/{season}/teamId/"
+        self.url_stats = f"{self.url_api_nba}/statistics/players/gameId/"
+        self.url_standings = f"{self.url_api_nba}/standings/standard/{season}/"
+        self.standings = NBAStandingsStore(
+            self.league.file_name(f'./cache/standings-{season}.json'),
+            ttl=int(os.getenv("STANDINGS_TTL", self.STANDINGS_TTL))
+        )
+        if games_state is None:
+            games_state = NBAGamesStateStore(self.league.file_name(os.getenv("GAMES_STATE_FILE",
+                                                                              self.GAMES_STATE_FILE)))
+        self.games_state = games_state
         self.games_df = pd.DataFrame()
 
         self.playoff_mode = playoff_mode  # PLAYOFF2021
@@ -43,108 +1439,336 @@ class NBAGamesDataCollector:
         # We need to use an additional API as the main API does not provide information about OTs
         self.HEADERS_API_BASKETBALL = {
 	        "X-RapidAPI-Key": self.API_KEY,
-	        "X-RapidAPI-Host": "api-basketball.p.rapidapi.com"
+	        "X-RapidAPI-Host": self.API_BASKETBALL_HOST
         }
         self.request_games_api_basketball = None
-        self.url_games_api_basketball = "https://api-basketball.p.rapidapi.com/games"
+        self.ot_index = OvertimeIndex()
+        self.url_games_api_basketball = os.getenv("API_BASKETBALL_URL", self.API_BASKETBALL_URL) + "/games"
+        self.url_standings_api_basketball = os.getenv("API_BASKETBALL_URL", self.API_BASKETBALL_URL) + "/standings"
+        self.params_api_basketball = {"season": self.league.api_basketball_season(season),
+                                      "league": str(self.league.api_basketball_id)}
+
+    # every API call goes through this method. Returns APIResult (see APIClient).
+    # ttl is a function deciding for how long the returned data can be cached, None if it shall not be cached
+    # archive_as = (kind, date, GameId) of the response in the archive (see NBAPayloadArchive)
+    def api_get(self, url, headers, params=None, ttl=None, fresh=False, decode=None, archive_as=None):
+        return self.api.get(url, headers, params, ttl, fresh, decode, archive_as)
+
+    # Cache policies of our endpoints. Data of finished games never changes, so it can be kept forever.
+    # If any game is not finished yet, the data will change soon
+    @staticmethod
+    def schedule_ttl(data):
+        games = data.get('api', {}).get('games', [])
+        if games and all(game.get('statusGame') == 'Finished' for game in games):
+            return math.inf
+        return ResponseCache.SHORT_TTL
+
+    @staticmethod
+    def games_api_basketball_ttl(data):
+        games = data.get('response', [])
+        # FT - finished, AOT - finished after over time
+        if games and all(game.get('status', {}).get('short') in ('FT', 'AOT') for game in games):
+            return math.inf
+        return ResponseCache.SHORT_TTL
+
+    # we ask for box scores of finished games only. Box scores are cached as BoxScoreFeatures records
+    # (see extract_box_score), responses cached before that as whole payloads
+    @staticmethod
+    def stats_ttl(data):
+        if data.get('results') or data.get('api', {}).get('statistics'):
+            return math.inf
+        return ResponseCache.SHORT_TTL
+
+    def standings_ttl(self, data):
+        return self.standings.ttl
+
+    # getting schedule of games of a date. Without it we cannot do anything, so if the call failed we stop
+    # fresh=True always asks the API (see APIClient.get)
+    def get_schedule(self, date: datetime.date, fresh=False):
+        if not self.league.api_nba:
+            return self.get_schedule_api_basketball(date, fresh)
+        result = self.api_get(self.url_games + str(date), headers=self.HEADERS, ttl=self.schedule_ttl, fresh=fresh,
+                              archive_as=('schedule', date, None))
+        if result.failed:
+            raise APIRequestFailed(f"Unable to get games for {date}: {result.error}")
+        return result
+
+    # schedule of a league api-nba does not cover, from api-basketball. Games are converted into games of api-nba
+    # (see api_basketball_game) and the response is kept as well under 'response', as it has OTs of the games
+    def get_schedule_api_basketball(self, date: datetime.date, fresh=False):
+        result = self.api_get(self.url_games_api_basketball, headers=self.HEADERS_API_BASKETBALL,
+                              params=dict(self.params_api_basketball, date=str(date)),
+                              ttl=self.games_api_basketball_ttl, fresh=fresh, archive_as=('schedule', date, None))
+        if result.failed:
+            raise APIRequestFailed(f"Unable to get {self.league.name} games for {date}: {result.error}")
+        response = result.data.get('response', [])
+        games = [api_basketball_game(game) for game in response]
+        return APIResult(result.status, {'api': {'results': len(games), 'games': games}, 'response': response},
+                         status_code=result.status_code)
 
     # getting games data in JSON
     def get_games_data(self, date: datetime.date = datetime.date.today()):
-        self.request_games = requests.get(self.url_games + str(date), headers=self.HEADERS)
-        # pause to avoid exceeding the limit of 10 calls per minute
-        time.sleep(self.API_PAUSE_TIME)
+        self.request_games = self.get_schedule(date)
 
         # We need to call another API to try te find out if there were any OTs in a game
-        try:
-            querystring = {"season":"2025-2026","league":"12","date":str(date)}
-
-            response = requests.get(
-                self.url_games_api_basketball, 
-                headers=self.HEADERS_API_BASKETBALL, 
-                params=querystring
-            )
-            self.request_games_api_basketball = response.json()
-
-        except requests.RequestException as e:
-            print(f"An error occurred: {e}")
-
-        finally:
-            # pause to avoid exceeding the limit of 10 calls per minute
-            time.sleep(self.API_PAUSE_TIME)
+        self.request_games_api_basketball = self.get_games_data_api_basketball(date)
+        self.build_ot_index()
 
         # checking number of games returned by the API
-        data = self.request_games.json()
-        return int(data['api']['results'])
-
-    # collecting data we need to proceed with scoring and save it in Pandas DataFrame
-    def get_games_stats(self, verbose=False):
-        columns = ['Status', 'Start Time UTC', 'Start Time ET', 'Start Time ET Date', 'Start Time CET', 'End Time UTC', 'End Time ET', 'End Time CET',
-                   'vTeamID', 'vPCT', 'vConfRank', 'Visitor', 'Visitor Pts', 'Host Pts', 'Host', 'hConfRank', 'hPCT', 'hTeamID',
-                   'pointsDiff', 'OT', 'OT2', 'vLogoLink', 'hLogoLink', 'Playoff', 'GameId', 'Highest pts']
-        lst = []
-
-        data = self.request_games.json()
-        for game in data['api']['games']:
-            finished = (game['statusGame'] == 'Finished')
+        return int(self.request_games.data['api']['results'])
+
+    # getting games data of a date from api-basketball in JSON. Returns None if the call failed
+    def get_games_data_api_basketball(self, date: datetime.date, fresh=False):
+        querystring = dict(self.params_api_basketball, date=str(date))
+
+        result = self.api_get(
+            self.url_games_api_basketball, 
+            headers=self.HEADERS_API_BASKETBALL, 
+            params=querystring,
+            ttl=self.games_api_basketball_ttl,
+            fresh=fresh,
+            archive_as=('api_basketball', date, None)
+        )
+        if result.failed:
+            print(f"An error occurred: {result.error}")
+            self.metrics.count("ot_data_unavailable")
+            return None
+        return result.data
+
+    # Collecting all games played on et_date in ET and all data we need to proceed with scoring.
+    # The API returns games for a date in UTC, so we need games of et_date and of the day after. Schedules of both
+    # days from both APIs are requested concurrently and merged, then the games are planned and enriched
+    # in get_games_stats. Returns final games number
+    def collect_games(self, et_date: datetime.date, verbose=False):
+        dates = [et_date, et_date + datetime.timedelta(days=1)]
+        with self.metrics.stage("schedule"), ThreadPoolExecutor(max_workers=self.API_WORKERS) as pool:
+            schedules = [pool.submit(self.get_schedule, date) for date in dates]
+            # schedules of leagues other than the NBA come from api-basketball and have OTs in them already
+            ot_dates = self.ot_dates_in_budget(dates) if self.league.api_nba else []
+            games_api_basketball = [pool.submit(self.get_games_data_api_basketball, date) for date in ot_dates]
+
+            games = []
+            for future in schedules:
+                games += future.result().data['api']['games']
+            self.request_games = schedules[0].result()
+
+            # if we could not get any data from api-basketball, we go on without it
+            self.request_games_api_basketball = None
+            for future in games_api_basketball:
+                if future.result() is not None:
+                    if self.request_games_api_basketball is None:
+                        self.request_games_api_basketball = {'response': []}
+                    self.request_games_api_basketball['response'] += future.result().get('response', [])
+            if not self.league.api_nba:
+                self.request_games_api_basketball = {
+                    'response': [game for future in schedules for game in future.result().data['response']]
+                }
+            self.build_ot_index()
+
+        return self.get_games_stats(verbose, et_date, games)
+
+    # OT data of a date covers only a part of games of an ET date, so we ask api-basketball for all dates or,
+    # if its daily quota is too low for that, for none - games are then flagged as scored without OT data
+    def ot_dates_in_budget(self, dates):
+        if self.rate_limiter.remaining(self.API_BASKETBALL_HOST) >= len(dates):
+            return dates
+        print(f"Not enough api-basketball quota for OT data of {len(dates)} dates, games are scored without it")
+        self.metrics.count("ot_data_unavailable")
+        return []
+
+    # the OT index is built once, as soon as we have games from api-basketball
+    def build_ot_index(self):
+        if self.request_games_api_basketball is None:
+            self.ot_index = OvertimeIndex()
+        else:
+            self.ot_index = OvertimeIndex(self.request_games_api_basketball.get('response', []))
+
+    # Planning stage: working out from the schedule payload alone which games need to be enriched.
+    # The API returns games for a date in UTC, while games are played (and ranked) by the date in ET, so a single
+    # payload contains games from 2 ET dates. We compute ET date and GameId for every game, remove duplicates and
+    # games that are not finished, and if et_date is given, discard games played on a different ET date.
+    # All of this happens before any standings or stats requests go out, so we do not spend API calls (and pauses)
+    # on games we would throw away anyway.
+    # games is a list of games from the API, by default the games from the last get_games_data call.
+    # Returns a list of ScheduledGame records
+    def plan_games(self, et_date: datetime.date = None, verbose=False, games=None):
+        candidates = []
+        seen_ids = set()
+
+        if games is None:
+            games = self.request_games.data['api']['games']
+        for game in games:
             # 31.08.2020
             # Around the end of August 2020 I encountered duplicate entries in games lists. One entry was finished
             # (correct). Other entries (usually additional one) were "scheduled" (duplicated). It might happened due to
             # BLM protest that forced games to be rescheduled. This all resulted in duplicates in the ranking.
-            # To avoid this I remove all not finished games from further processing. Some code that comes after this
-            # condition assumes that game might not be finished yet.
-            # However there should be no more unfinished games in the processing engine after this line***.
-            if not finished:
-                no_OT = 0
-                points_diff = 0
-                continue  # *** added condition
-            else:
-                no_OT = int(game['currentPeriod'][0:1]) - 4
-                points_diff = abs(int(game['vTeam']['score']['points']) - int(game['hTeam']['score']['points']))
-                game_id = game['gameId']  # we add game ID to be able to collect game stats from another endpoint
-                highest_pts = 0  # From game stats we want the highest scoring for a player
-                no_OT2 = 0  # Number of OTs we take from another API call in case the main API call contains incorrect data
-
-            if verbose:
-                print(game['vTeam']['shortName'], "-", game['hTeam']['shortName'], ":",
-                      game['vTeam']['score']['points'], game['hTeam']['score']['points'],
-                      "finished:", game['statusGame'], game_id)
+            # To avoid this I remove all not finished games from further processing.
+            if game.get('statusGame') != 'Finished':
+                continue
 
             # Sometimes, due to error in a response, there is an empty element in data['api']['games']
             # In that case we want to skip it
-            v_team_id = game['vTeam']['teamId']
-            if (v_team_id is None or v_team_id == ""): continue
+            game = ScheduledGame.from_api(game)
+            if game is None:
+                continue
+
+            # the same game may be listed more than once - we keep the first entry only
+            if game.game_id in seen_ids:
+                continue
+
+            seen_ids.add(game.game_id)
+            candidates.append(game)
+
+        if et_date is None or not candidates:
+            return candidates
+
+        # ET dates of all games are computed at once and compared as dates
+        start_times = format_api_times([game.start_time_utc for game in candidates])
+        on_et_date = (start_times['et_day'] == pd.Timestamp(et_date)).to_numpy()
+        if verbose:
+            for game, keep, start_time_et_date in zip(candidates, on_et_date, start_times['et_date_str']):
+                if not keep:
+                    print("Skipping", game.v_short_name, "-", game.h_short_name,
+                          "played on", start_time_et_date, game.game_id)
+        return [game for game, keep in zip(candidates, on_et_date) if keep]
 
-            # for each team in a match-up we collect win PCT and ranking in its conference
-            self.get_team_data(v_team_id)
-            team_data = self.request_team.json()
-            v_team_rank = int(team_data['api']['standings'][0]['conference']['rank'])
-            v_team_pct = float(team_data['api']['standings'][0]['winPercentage'])
-
-            # the same for the host team
-            h_team_id = game['hTeam']['teamId']
-            if (h_team_id is None or h_team_id == ""): continue
+    # collecting data we need to proceed with scoring and save it in Pandas DataFrame
+    # if et_date is given, only games played on that date in ET are enriched (see plan_games)
+    def get_games_stats(self, verbose=False, et_date: datetime.date = None, games=None):
+        records = []
+
+        # only finished, deduplicated games (from the given ET date) are processed - see plan_games
+        with self.metrics.stage("plan"):
+            planned = self.plan_games(et_date, verbose, games)
+
+        # Games enriched by earlier runs, which have not changed since then, are taken from the state store.
+        # Only new or changed games need standings and stats from the API.
+        # An entry is also not reused if we could not get the highest pts last time (in leagues that have box scores)
+        stored = {game.game_id: self.games_state.get(game) for game in planned}
+        for game_id, entry in stored.items():
+            if entry is not None and entry['highest_pts'] is None and self.league.api_nba:
+                stored[game_id] = None
+        to_enrich = [game for game in planned if stored[game.game_id] is None]
+
+        # Standings of the league and box scores of the games do not depend on each other, so all these calls
+        # are issued concurrently. The rate limiter keeps them within limits of our API plans.
+        # If the daily quota left does not cover all of them, standings go first and box scores are requested only
+        # for games they matter most for (see plan_box_scores)
+        with self.metrics.stage("enrich"), ThreadPoolExecutor(max_workers=self.API_WORKERS) as pool:
+            if not self.league.api_nba:
+                standings = pool.submit(self.get_standings) if to_enrich else None
+                box_scores = []
+            elif self.box_score_budget(to_enrich) >= len(to_enrich):
+                standings = pool.submit(self.get_standings) if to_enrich else None
+                box_scores = to_enrich
+            else:
+                self.get_standings()
+                standings = None
+                box_scores = self.plan_box_scores(to_enrich)
+            # box scores are archived under the ET date of the run or, without it, the UTC date of the game
+            box_score_futures = {
+                game.game_id: pool.submit(self.get_box_score, game.game_id, verbose,
+                                          et_date or (game.start_time_utc or "")[:10])
+                for game in box_scores
+            }
+            if standings is not None:
+                standings.result()
+
+        # start and end times of all games in UTC, ET and CET are converted at once.
+        # We have finished games only here, so all of them have the end time
+        build_started = time.perf_counter()
+        start_times = format_api_times([game.start_time_utc for game in planned])
+        end_times = format_api_times([game.end_time_utc for game in planned])
+
+        for i, game in enumerate(planned):
+            finished = True  # Some code that comes after this line assumes that game might not be finished yet.
+            no_OT = game.no_OT
+            points_diff = abs(game.v_points - game.h_points)
+            game_id = game.game_id  # we add game ID to be able to collect game stats from another endpoint
+            highest_pts = 0  # From game stats we want the highest scoring for a player
+            no_OT2 = 0  # Number of OTs we take from another API call in case the main API call contains incorrect data
 
-            self.get_team_data(h_team_id)
-            team_data = self.request_team.json()
-            h_team_rank = int(team_data['api']['standings'][0]['conference']['rank'])
-            h_team_pct = float(team_data['api']['standings'][0]['winPercentage'])
+            if verbose:
+                print(game.v_short_name, "-", game.h_short_name, ":", game.v_points, game.h_points,
+                      "finished:", game.status, game_id)
 
-            # Getting start time in UTC, ET and CET in the right format
-            start_time_utc, start_time_et, start_time_et_date, start_time_cet = self.get_formatted_dates(game['startTimeUTC'])
+            # Start time in UTC, ET and CET in the right format
+            start_time_utc = start_times['utc_str'].iat[i]
+            start_time_et = start_times['et_str'].iat[i]
+            start_time_et_date = start_times['et_date_str'].iat[i]
+            start_time_cet = start_times['cet_str'].iat[i]
 
-            # Getting end time in UTC, ET and CET in the right format - only if gamed is finished
+            # End time in UTC, ET and CET in the right format - only if gamed is finished
             if not finished:
                 end_time_utc = None
                 end_time_et = None
                 end_time_cet = None
             else:
-                end_time_utc, end_time_et, _, end_time_cet = self.get_formatted_dates(game['endTimeUTC'])
+                end_time_utc = end_times['utc_str'].iat[i]
+                end_time_et = end_times['et_str'].iat[i]
+                end_time_cet = end_times['cet_str'].iat[i]
+
+            entry = stored[game_id]
+            if entry is None:
+                # for each team in a match-up we collect win PCT and ranking in its conference
+                v_team_rank, v_team_pct = self.get_team_standing(game.v_team_id)
+
+                # the same for the host team
+                h_team_rank, h_team_pct = self.get_team_standing(game.h_team_id)
+
+                # features of the box score (the highest scoring for a player in a game etc.),
+                # None if the box score was dropped or unavailable
+                box_score = box_score_futures[game_id].result() if game_id in box_score_futures else None
+                highest_pts = None if box_score is None else box_score.highest_pts
+
+                # get the number of OTs from another API
+                no_OT2 = self.calculate_OTs(game.h_full_name, verbose, start_time_et_date, game.v_full_name)
+
+                self.games_state.put(game, {
+                    'standings_version': self.standings.fetched_at,
+                    'v_rank': v_team_rank, 'v_pct': v_team_pct,
+                    'h_rank': h_team_rank, 'h_pct': h_team_pct,
+                    'highest_pts': highest_pts,
+                    'box_score': None if box_score is None else asdict(box_score),
+                    'no_OT2': no_OT2,
+                    'ot_available': self.ot_index.available,
+                    'score': None,
+                })
+                ot_available = self.ot_index.available
+            else:
+                # If we have standings newer than the ones the game was enriched with (and we do not need
+                # an API call to get them), we use them - as a full run would
+                if ((self.standings.is_fresh() or self.standings.load())
+                        and entry['standings_version'] != self.standings.fetched_at):
+                    entry['v_rank'], entry['v_pct'] = self.get_team_standing(game.v_team_id)
+                    entry['h_rank'], entry['h_pct'] = self.get_team_standing(game.h_team_id)
+                    entry['standings_version'] = self.standings.fetched_at
+                v_team_rank, v_team_pct = entry['v_rank'], entry['v_pct']
+                h_team_rank, h_team_pct = entry['h_rank'], entry['h_pct']
+                highest_pts = entry['highest_pts']
+                # entries stored before box score features were kept have only the highest pts
+                box_score = BoxScoreFeatures(**entry['box_score']) if entry.get('box_score') else None
+                # a game scored without OT data gets OTs as soon as we have them - as a full run would
+                if entry.get('ot_available') is False and self.ot_index.available:
+                    entry['no_OT2'] = self.calculate_OTs(game.h_full_name, verbose, start_time_et_date,
+                                                         game.v_full_name)
+                    entry['ot_available'] = True
+                no_OT2 = entry['no_OT2']
+                ot_available = entry.get('ot_available', True)
+
+            # a game scored without some of its data is flagged, so it does not silently get 0 for it.
+            # Leagues other than the NBA have no box scores at all, so their games are not flagged for that
+            missing_box_score = self.league.api_nba and highest_pts is None
+            degraded = ",".join(name for name, missing in [('highest_pts', missing_box_score),
+                                                           ('OT', not ot_available)] if missing)
+            if degraded:
+                self.metrics.count("degraded_games")
 
             # Getting points for a playoff game # PLAYOFF2021
             playoff_pts = 0
             if self.playoff_mode:
                 # we are looking for the visiting team entry. If not found just leave playoff_pts at 0
-                short_name = game['vTeam']['shortName']
+                short_name = game.v_short_name
                 #if verbose:
                 print("(", start_time_et, ") Looking for:", short_name)
                 try:
@@ -155,112 +1779,201 @@ class NBAGamesDataCollector:
                     # if verbose:
                     print("Not found!", short_name)
 
-            # checking the highest scoring for a player in a game
-            highest_pts = self.get_the_highest_pts(game_id, verbose)
-
-            # get the number of OTs from another API
-            no_OT2 = self.calculate_OTs(game['hTeam']['fullName'], verbose)
-
-            lst.append([
-                game['statusGame'],
-                start_time_utc,
-                start_time_et,
-                start_time_et_date,
-                start_time_cet,
-                end_time_utc,
-                end_time_et,
-                end_time_cet,
-                game['vTeam']['teamId'],
-                v_team_pct,
-                v_team_rank,
-                game['vTeam']['shortName'],
-                game['vTeam']['score']['points'],
-                game['hTeam']['score']['points'],
-                game['hTeam']['shortName'],
-                h_team_rank,
-                h_team_pct,
-                game['hTeam']['teamId'],
-                points_diff,
-                no_OT,
-                no_OT2,
-                game['vTeam']['logo'],
-                game['hTeam']['logo'],
-                playoff_pts,  # PLAYOFF2021
-                game_id,  
-                highest_pts,
-            ])
-
-        self.games_df = pd.DataFrame(lst, columns=columns)
+            records.append(GameRecord(
+                status=game.status,
+                start_time_utc=start_time_utc,
+                start_time_et=start_time_et,
+                start_time_et_date=start_time_et_date,
+                start_time_cet=start_time_cet,
+                end_time_utc=end_time_utc,
+                end_time_et=end_time_et,
+                end_time_cet=end_time_cet,
+                v_team_id=game.v_team_id,
+                v_pct=v_team_pct,
+                v_conf_rank=v_team_rank,
+                visitor=game.v_short_name,
+                visitor_pts=game.v_points,
+                host_pts=game.h_points,
+                host=game.h_short_name,
+                h_conf_rank=h_team_rank,
+                h_pct=h_team_pct,
+                h_team_id=game.h_team_id,
+                points_diff=points_diff,
+                no_OT=no_OT,
+                no_OT2=no_OT2,
+                v_logo_link=game.v_logo,
+                h_logo_link=game.h_logo,
+                playoff=int(playoff_pts),  # PLAYOFF2021
+                game_id=game_id,
+                highest_pts=highest_pts,
+                pts_40=None if box_score is None else box_score.pts_40,
+                double_doubles=None if box_score is None else box_score.double_doubles,
+                triple_doubles=None if box_score is None else box_score.triple_doubles,
+                degraded=degraded,
+            ))
+
+        self.games_state.save()
+        # all records are converted into DataFrame at once
+        self.games_df = games_to_df(records)
+        self.metrics.add_stage("build", time.perf_counter() - build_started)
         return len(self.games_df) # returns final games number
 
+    # Number of api-nba calls we can spend today on box scores of games, after calls we cannot score without:
+    # standings of the league (or of single teams, if the league endpoint failed in this run).
+    # If the quota does not cover even these, APIQuotaExceeded is raised before any of them goes out,
+    # instead of failing halfway through the run
+    def box_score_budget(self, games):
+        if not games:
+            return 0
+        if self.standings.is_fresh() or self.standings.load():
+            required = 0
+        elif self.standings_unavailable:
+            required = len(self.teams_without_standings(games))
+        else:
+            required = 1
+        remaining = self.rate_limiter.remaining(self.API_NBA_HOST)
+        if remaining < required:
+            raise APIQuotaExceeded(f"{required} calls needed for standings, {remaining} calls left today")
+        return remaining - required
+
+    def teams_without_standings(self, games):
+        return {team_id for game in games for team_id in (game.v_team_id, game.h_team_id)
+                if self.standings.get(team_id) is None}
+
+    # Box scores of games that fit in the quota left after standings are requested, the others are dropped.
+    # Games are taken in order of box_score_priority, so we drop box scores that are least likely to change
+    # the ranking. Games without a box score are scored without the highest pts and flagged as degraded;
+    # the next run asks for their box scores again (see get_games_stats). Returns games to request box scores for
+    def plan_box_scores(self, games):
+        budget = self.rate_limiter.remaining(self.API_NBA_HOST) - len(self.teams_without_standings(games))
+        if budget < 0:
+            raise APIQuotaExceeded(f"{-budget} more calls needed for standings of teams than left today")
+        ranked = self.box_score_priority(games)
+        for game in ranked[budget:]:
+            print(f"Not enough API quota for the box score of {game.v_short_name} - {game.h_short_name} "
+                  f"({game.game_id}), the game is scored without the highest pts")
+            self.metrics.count("box_scores_dropped")
+        return ranked[:budget]
+
+    # Order in which box scores are worth requesting: the closest games first, as the highest pts matter the least
+    # for blowouts. NBAGamesScoringCalculator ranks games by their whole score without the box score
+    def box_score_priority(self, games):
+        return sorted(games, key=lambda game: abs(game.v_points - game.h_points))
+
+    # writes metrics of the run (see RunMetrics) to file_prefix.prom and file_prefix.json, together with quota
+    # left on both hosts, e.g. write_metrics("./scoring/metrics-2025-01-10")
+    def write_metrics(self, file_prefix):
+        for host in self.API_LIMITS:
+            self.metrics.set_quota(host, self.rate_limiter.remaining(host))
+        self.metrics.write(file_prefix)
+
     # get playoff data from file to supplement scoring # PLAYOFF2021
     def get_playoff_data(self):
         if self.playoff_mode:
             self.playoff_df = pd.read_csv('./scoring/playoff.csv')
 
+    # get standings of the whole league - from the file if it is fresh enough, otherwise with a single API call
+    # If the call fails, we do not try again in this run - teams are looked up with the per-team endpoint instead
+    def get_standings(self):
+        if self.standings.is_fresh() or self.standings.load() or self.standings_unavailable:
+            return
+
+        if self.league.api_nba:
+            result = self.api_get(self.url_standings, headers=self.HEADERS, ttl=self.standings_ttl,
+                                  archive_as=('standings', datetime.date.today(), None))
+        else:
+            result = self.api_get(self.url_standings_api_basketball, headers=self.HEADERS_API_BASKETBALL,
+                                  params=self.params_api_basketball, ttl=self.standings_ttl,
+                                  archive_as=('standings', datetime.date.today(), None))
+        if not result.ok:
+            print(f"Unable to get standings of the league: {result.error or result.status}")
+            self.metrics.count("standings_unavailable")
+            self.standings_unavailable = True
+            return
+
+        try:
+            if self.league.api_nba:
+                self.standings.update(result.data['api']['standings'])
+            else:
+                self.standings.update(NBAStandingsStore.from_api_basketball(result.data['response']))
+            self.standings.save()
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Unable to get standings of the league: {e}")
+            self.metrics.count("standings_unavailable")
+            self.standings_unavailable = True
+
+    # returns (conference rank, win PCT) of a team. We look the team up in the standings of the whole league
+    # and only if it is not there we ask the per-team endpoint
+    def get_team_standing(self, team_id):
+        self.get_standings()
+        standing = self.standings.get(team_id)
+        if standing is None:
+            # api-basketball has no per-team endpoint
+            if not self.league.api_nba:
+                raise APIRequestFailed(f"No standings of {self.league.name} team {team_id}")
+            self.get_team_data(team_id)
+            if not self.request_team.ok:
+                raise APIRequestFailed(f"Unable to get standings of team {team_id}: "
+                                       f"{self.request_team.error or self.request_team.status}")
+            self.standings.add(self.request_team.data['api']['standings'][:1])
+            standing = self.standings.get(team_id)
+        return standing
+
     # get team data in JSON to collect data like win PCT or current rank
     def get_team_data(self, team_id):
         # print("Team ID:", team_id)
-        self.request_team = requests.get(self.url_team + team_id, headers=self.HEADERS)
-        # pause to avoid exceeding the limit of 10 calls per minute
-        time.sleep(self.API_PAUSE_TIME)
+        self.request_team = self.api_get(self.url_team + team_id, headers=self.HEADERS, ttl=self.standings_ttl,
+                                         archive_as=('standings', datetime.date.today(), None))
+
+    # Features of the box score of a game (see BoxScoreFeatures): the statistics of players are streamed and reduced
+    # to a compact record as they are downloaded (see extract_box_score), so they are never decoded as a whole.
+    # Returns empty features if there are no stats for the game and None if we were unable to get them
+    # date is the date of the game (yyyy-mm-dd), the response is archived under it
+    def get_box_score(self, game_id, verbose=False, date=None):
+        result = self.api_get(self.url_stats + game_id, headers=self.HEADERS, ttl=self.stats_ttl,
+                              decode=extract_box_score, archive_as=('box_score', date, game_id))
+        if result.failed:
+            print(f"Unable to get stats for game id {game_id}: {result.error}")
+            self.metrics.count("highest_pts_unavailable")
+            return None
 
-    def get_the_highest_pts(self, game_id, verbose=False):
-        highest_pts = 0
         try:
-            response = requests.get(self.url_stats + game_id, headers=self.HEADERS)
-
-            data = response.json()
-            
-            for player in data['api']['statistics']:
-                if int(player['points']) > highest_pts:
-                    highest_pts = int(player['points'])
-        except requests.RequestException as e:
-            print(f"An error occurred: {e}")
-
-        except json.JSONDecodeError:
-            print("Failed to decode JSON response.")
-        
-        except Exception as e:
-            print(f"An unexpected error occurred: {e}")
-        finally:
-            # pause to avoid exceeding the limit of 10 calls per minute
-            time.sleep(self.API_PAUSE_TIME)
+            if 'api' in result.data:  # a whole payload, cached before box scores were reduced to features
+                box_score = BoxScoreFeatures.from_players(result.data['api']['statistics'])
+            else:
+                box_score = BoxScoreFeatures(**result.data['box_score'])
+        except (KeyError, TypeError, ValueError) as e:
+            print(f"Unexpected stats for game id {game_id}: {result.data.get('error') or e}")
+            self.metrics.count("highest_pts_unavailable")
+            return None
+
+        if verbose:
+            print(f"Highest pts for game id {game_id}: {box_score.highest_pts}")
+        return box_score
+
+    # number of OTs of a game from api-basketball, 0 if the game is not there (or we were unable to get the data)
+    # et_date (yyyy-mm-dd) is the date of the game in ET and team names are full names (ScheduledGame.*_full_name)
+    def calculate_OTs(self, home_team_name, verbose=False, et_date=None, visitor_team_name=None):
+        if not self.ot_index.available:
             if verbose:
-                print(f"Highest pts for game id {game_id}: {highest_pts}")
-
-        return highest_pts
-
-    def calculate_OTs(self, home_team_name, verbose=False):
-        no_OT2 = 0
-        
-        # data has been collected in self.request_games_api_basketball
-        # game_name input parameter is the name of the home team from game['hTeam']['fullName']
-        # we need to find the game in the list and then if points in OT are > 0, then assign no_OT2 = 1
-        for game in self.request_games_api_basketball['response']:
-            if game.get('teams', {}).get('home', {}).get('name') == home_team_name:
-                over_time = game.get('scores', {}).get('home', {}).get('over_time')
-                if over_time is not None:
-                    no_OT2 = 1
-                break                           
-
-        return no_OT2
+                print("No OT data from api-basketball for", home_team_name)
+            return 0
+        return self.ot_index.lookup(et_date, home_team_name, visitor_team_name)
 
     # getting list of seasons in JSON 
     def get_seasons(self):
-        url = "https://api-nba-v1.p.rapidapi.com/seasons/"
-        response = requests.get(url, headers=self.HEADERS)
-        # pause to avoid exceeding the limit of 10 calls per minute
-        time.sleep(self.API_PAUSE_TIME)        
+        url = f"{self.url_api_nba}/seasons/"
+        return self.api_get(url, headers=self.HEADERS)
 
     # converting datetime returned from the API as string, into a time-zoned, formatted datetime object
+    # To convert many values at once use format_api_times
     def get_formatted_dates(self, date):
         # date format in API: 2019-12-04T02:09:00.000Z
         utc = pytz.utc
-        eastern = pytz.timezone('US/Eastern')
-        warsaw = pytz.timezone('Europe/Warsaw')
-        fmt = '%Y-%m-%d %H:%M'
-        fmt2 = '%Y-%m-%d'
+        eastern = pytz.timezone(TIME_ZONE_ET)
+        warsaw = pytz.timezone(TIME_ZONE_CET)
+        fmt = TIME_FORMAT
+        fmt2 = DATE_FORMAT
 
         # Converting datetime returned from the API as string into a timezone-naive datetime object
         # Date format is usually '%Y-%m-%dT%H:%M:%S.%fZ'. However sometimes it's only '%Y-%m-%d',
@@ -286,14 +1999,45 @@ class NBAGamesDataCollector:
 
 # Class that calculates scoring for collected games data
 class NBAGamesScoringCalculator(NBAGamesDataCollector):
-    def __init__(self, playoff_mode=False):  # PLAYOFF2021
-        super().__init__(playoff_mode)
+    def __init__(self, playoff_mode=False, rate_limiter=None, response_cache=None, games_state=None,
+                 season=None, metrics=None, league=None):  # PLAYOFF2021
+        super().__init__(playoff_mode, rate_limiter, response_cache, games_state, season, metrics, league)
+
+    # Calculating score for pandas dataframe. By default all rows are scored at once with array operations
+    # (see calculate_vectorized). row_wise=True applies function calculate to each individual row instead.
+    # Scores are also kept in the games state store together with data they were calculated from
+    def calculate_score(self, row_wise=False):
+        with self.metrics.stage("score"):
+            if row_wise:
+                self.games_df['SCORE: 0 - 100'] = self.games_df.apply(self.calculate, axis=1)
+            else:
+                self.games_df['SCORE: 0 - 100'] = self.calculate_vectorized(self.games_df)
 
-    # Calculating score for pandas dataframe. We function calculate to each individual row
-    def calculate_score(self):
-        self.games_df['SCORE: 0 - 100'] = self.games_df.apply(self.calculate, axis=1)
+        for game_id, score in zip(self.games_df['GameId'], self.games_df['SCORE: 0 - 100']):
+            self.games_state.set_score(game_id, int(score))
+        self.games_state.save()
         return self.games_df
 
+    # Box scores of games with the highest score without the highest pts go first: the highest pts add at most
+    # 15 points, so they matter for games at the top of the ranking (or close to it) and not for blowouts at
+    # the bottom. Standings are known at this point (see plan_box_scores)
+    def box_score_priority(self, games):
+        rows = []
+        start_times = format_api_times([game.start_time_utc for game in games])
+        for game, start_time_et_date in zip(games, start_times['et_date_str']):
+            v_rank, v_pct = self.get_team_standing(game.v_team_id)
+            h_rank, h_pct = self.get_team_standing(game.h_team_id)
+            rows.append({
+                'Status': game.status, 'pointsDiff': abs(game.v_points - game.h_points), 'OT': game.no_OT,
+                'OT2': self.calculate_OTs(game.h_full_name, et_date=start_time_et_date,
+                                          visitor_team_name=game.v_full_name),
+                'vPCT': v_pct, 'hPCT': h_pct, 'vConfRank': v_rank, 'hConfRank': h_rank, 'Playoff': 0,
+                'Highest pts': 0,
+            })
+        base_scores = self.calculate_vectorized(pd.DataFrame(rows))
+        order = sorted(range(len(games)), key=lambda i: -base_scores.iat[i])
+        return [games[i] for i in order]
+
     # Method calculates scoring for a row (a game) in pandas dataset
     # All parameters are here
     def calculate(self, row):
@@ -378,18 +2122,274 @@ class NBAGamesScoringCalculator(NBAGamesDataCollector):
 
         return scoring
 
+    # Scoring of all rows (games) of a dataframe at once. Every rule of calculate is evaluated for the whole column
+    # with np.select, in the same order as the if/elif chains there, so the scores are identical to calculate
+    def calculate_vectorized(self, games):
+        if len(games) == 0:
+            return pd.Series([], index=games.index, dtype='int64')
+
+        def column(name):
+            return pd.to_numeric(games[name], errors='coerce').to_numpy(dtype='float64')
+
+        points_diff = np.trunc(column('pointsDiff'))
+        # we take the higher number of OTs from both APIs
+        no_OT = np.maximum(np.trunc(column('OT')), np.trunc(column('OT2')))
+        v_pct = column('vPCT')
+        h_pct = column('hPCT')
+        highest_pts = column('Highest pts')
+
+        # increase scoring if game went to OT or was very close
+        scoring = np.select(
+            [no_OT >= 3, no_OT == 2, no_OT == 1,
+             points_diff == 1,
+             (points_diff > 1) & (points_diff <= 3),
+             (points_diff > 3) & (points_diff <= 6),
+             (points_diff > 6) & (points_diff <= 10),
+             (points_diff > 10) & (points_diff <= 15)],
+            [30, 29, 27, 27, 25, 19, 8, 1],
+            default=0
+        )
+
+        # if visiting team has a better win PCT the game may be more leveled
+        scoring += np.where(v_pct > h_pct, 3, 0)
+
+        # We add score depending on combined ranking of teams
+        combined_rank = column('vConfRank') + column('hConfRank')
+        scoring += np.select(
+            [combined_rank <= 5,
+             (combined_rank > 5) & (combined_rank <= 10),
+             (combined_rank > 10) & (combined_rank <= 16)],
+            [10, 8, 4],
+            default=0
+        )
+
+        # we add score if winning PCT of both teams is close to each other
+        PCT_diff = np.abs(v_pct - h_pct)
+        scoring += np.select(
+            [PCT_diff <= 0.02,
+             (PCT_diff > 0.02) & (PCT_diff <= 0.04),
+             (PCT_diff > 0.04) & (PCT_diff <= 0.1),
+             (PCT_diff > 0.1) & (PCT_diff <= 0.2),
+             (PCT_diff > 0.2) & (PCT_diff <= 0.3)],
+            [7, 5, 4, 2, 1],
+            default=0
+        )
+
+        # we add score for interesting playoff series - max 4 pts # PLAYOFF2021
+        if self.playoff_mode:
+            scoring += np.trunc(column('Playoff')).astype('int64')
+
+        # We add some point if there was exception indivudual scoring
+        scoring += np.select(
+            [highest_pts >= 55, highest_pts >= 48, highest_pts >= 45, highest_pts >= 40],
+            [15, 10, 5, 3],
+            default=0
+        )
+
+        # normalization to 0 - 100. np.rint rounds half to even, exactly as round() does in calculate
+        max_scoring = 69 if self.playoff_mode else 65  # PLAYOFF2021
+        scoring = np.rint((scoring / max_scoring) * 100).astype('int64')
+
+        # If game didn't finish we do not calculate a scoring
+        scoring = np.where(games['Status'].to_numpy() == 'Finished', scoring, 0)
+        return pd.Series(scoring, index=games.index, dtype='int64')
+
+    # Verification of the vectorized scoring against the row-wise one. Returns rows for which scores differ
+    def verify_scores(self, games=None):
+        if games is None:
+            games = self.games_df
+        row_wise = games.apply(self.calculate, axis=1) if len(games) > 0 else pd.Series([], dtype='int64')
+        vectorized = self.calculate_vectorized(games)
+        return games.loc[row_wise.to_numpy() != vectorized.to_numpy()]
+
     # printing JSON
     def print_games_json(self):
-        print(json.dumps(self.request_games.json(), sort_keys=False, indent=3))
-
-    # dumping games in JSON to a file
-    def write_games_to_file(self, file_name):
-        with open(file_name, "w") as p:
-            p.write(json.dumps(self.request_games.json(), sort_keys=False, indent=3))
+        print(json.dumps(self.request_games.data, sort_keys=False, indent=3))
+
+
+# this function returns the season a date belongs to, as the year the season starts in.
+# NBA seasons start in October and end in June, so e.g. 2026-01-15 belongs to season 2025 (2025-2026)
+def season_of(date: datetime.date):
+    return date.year if date.month >= 8 else date.year - 1
+
+
+# Store of calculated rankings in a SQLite database. Every scoring run appends one snapshot (a "run") of the ranking
+# for a date, so the history of rankings is kept and can be queried. The latest ranking for a date is a read through
+# an index on (date, playoff, run_id). CSV files are derived from the store (see export_csv).
+class NBARankingStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT NOT NULL,
+            playoff INTEGER NOT NULL,
+            created_at TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_date ON runs (date, playoff, run_id);
+        CREATE TABLE IF NOT EXISTS rankings (
+            run_id INTEGER NOT NULL REFERENCES runs (run_id),
+            position INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            game_id TEXT NOT NULL,
+            start_time_et TEXT,
+            visitor TEXT NOT NULL,
+            host TEXT NOT NULL,
+            v_team_id TEXT,
+            h_team_id TEXT,
+            v_logo TEXT,
+            h_logo TEXT,
+            score INTEGER NOT NULL,
+            degraded TEXT,
+            PRIMARY KEY (run_id, position)
+        );
+        CREATE INDEX IF NOT EXISTS rankings_date ON rankings (date);
+        CREATE INDEX IF NOT EXISTS rankings_game_id ON rankings (game_id);
+    """
+    # columns of the rankings table and games_df columns they come from
+    COLUMNS = {
+        'game_id': 'GameId',
+        'start_time_et': 'Start Time ET',
+        'visitor': 'Visitor',
+        'host': 'Host',
+        'v_team_id': 'vTeamID',
+        'h_team_id': 'hTeamID',
+        'v_logo': 'vLogoLink',
+        'h_logo': 'hLogoLink',
+        'score': 'SCORE: 0 - 100',
+        'degraded': 'Degraded',
+    }
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        os.makedirs(os.path.dirname(file_name) or ".", exist_ok=True)
+        db = self.connect()
+        try:
+            with db:
+                db.executescript(self.SCHEMA)
+                # stores created before games were flagged as degraded
+                if 'degraded' not in [column[1] for column in db.execute("PRAGMA table_info(rankings)")]:
+                    db.execute("ALTER TABLE rankings ADD COLUMN degraded TEXT")
+        finally:
+            db.close()
+
+    # a new connection for every operation, so the store can be used from many threads.
+    # WAL lets readers (e.g. the query service) read while a scoring run writes
+    def connect(self):
+        db = sqlite3.connect(self.file_name, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    # appends a snapshot of the ranking for a date: finished games, starting from the highest scoring.
+    # Returns id of the run
+    def append(self, games, date: str, playoff_mode=False):
+        ranking = games.loc[games['Status'] == "Finished"].sort_values(by=['SCORE: 0 - 100'], ascending=False)
+        rows = [
+            (position, date) + tuple(None if pd.isna(value) else value.item() if hasattr(value, 'item') else value
+                                     for value in values)
+            for position, values in enumerate(ranking[list(self.COLUMNS.values())].itertuples(index=False, name=None))
+        ]
+
+        db = self.connect()
+        try:
+            with db:
+                cursor = db.execute("INSERT INTO runs (date, playoff, created_at) VALUES (?, ?, ?)",
+                                    (date, int(playoff_mode), datetime.datetime.now().isoformat(timespec='seconds')))
+                run_id = cursor.lastrowid
+                db.executemany(
+                    f"INSERT INTO rankings (run_id, position, date, {', '.join(self.COLUMNS)}) "
+                    f"VALUES (?, ?, ?, {', '.join('?' * len(self.COLUMNS))})",
+                    [(run_id,) + row for row in rows]
+                )
+        finally:
+            db.close()
+        return run_id
 
+    def query(self, sql, params=()):
+        db = self.connect()
+        try:
+            return pd.read_sql_query(sql, db, params=params)
+        finally:
+            db.close()
+
+    # the latest ranking for a date, ordered by position (an empty DataFrame if there is none)
+    def latest(self, date: str, playoff_mode=False):
+        return self.query(
+            "SELECT * FROM rankings WHERE run_id = "
+            "(SELECT MAX(run_id) FROM runs WHERE date = ? AND playoff = ?) ORDER BY position",
+            (date, int(playoff_mode))
+        )
+
+    # the latest rankings of all dates (or dates from start to end), ordered by date and position
+    def latest_all(self, start: str = "0000-00-00", end: str = "9999-99-99", playoff_mode=False):
+        return self.query(
+            "SELECT rankings.* FROM rankings JOIN "
+            "(SELECT MAX(run_id) AS run_id FROM runs WHERE date BETWEEN ? AND ? AND playoff = ? GROUP BY date) "
+            "AS latest USING (run_id) ORDER BY rankings.date, rankings.position",
+            (start, end, int(playoff_mode))
+        )
+
+    # id of the latest run of every date (or dates from start to end): {date: run_id}. Tells cheaply which dates
+    # have a new ranking since we last looked
+    def latest_runs(self, start: str = "0000-00-00", end: str = "9999-99-99", playoff_mode=False):
+        db = self.connect()
+        try:
+            return dict(db.execute(
+                "SELECT date, MAX(run_id) FROM runs WHERE date BETWEEN ? AND ? AND playoff = ? GROUP BY date",
+                (start, end, int(playoff_mode))
+            ).fetchall())
+        finally:
+            db.close()
 
-# this function returns styled html for the limited scope of columns
-def print_scoring_html_styled(games):
+    # id of the latest run of all dates, 0 if the store is empty. It changes whenever a scoring run lands
+    def last_run_id(self):
+        db = self.connect()
+        try:
+            return db.execute("SELECT COALESCE(MAX(run_id), 0) FROM runs").fetchone()[0]
+        finally:
+            db.close()
+
+    # all runs for a date, the latest first
+    def runs(self, date: str):
+        return self.query("SELECT * FROM runs WHERE date = ? ORDER BY run_id DESC", (date,))
+
+    # CSV view of the latest ranking for a date, in the format of the files we always wrote
+    def export_csv(self, date: str, file_name, playoff_mode=False):
+        ranking = self.latest(date, playoff_mode)
+        ranking = ranking.rename(columns={'visitor': 'Visitor', 'host': 'Host', 'score': 'SCORE: 0 - 100'})
+        # the file is replaced atomically, so a reader never sees a half-written ranking
+        tmp_file_name = file_name + ".tmp"
+        with open(tmp_file_name, "w+") as file:
+            file.write(ranking[['Visitor', 'Host', 'SCORE: 0 - 100']].to_csv(index=False))
+        os.replace(tmp_file_name, file_name)
+
+
+# Rankings are stored here
+RANKING_STORE_FILE = './scoring/rankings.sqlite'
+
+
+# Ready marker tells post-tweet.py that the ranking of the date is complete: ./scoring/scoring-<date>[-po].ready
+# It is a small JSON file (date, number of games, csv file) renamed into place atomically, after the csv is written.
+# It is written also when no games were played, so the publisher does not wait for a csv that will never come
+# directory is the one of the league (League.scoring_dir), ./scoring for the NBA
+def ready_marker_file(date: str, playoff_mode=False, directory="./scoring"):
+    po = "-po" if playoff_mode else ""  # PLAYOFF2021
+    return directory + "/scoring-" + date + po + ".ready"
+
+
+def write_ready_marker(date: str, no_of_games, playoff_mode=False, directory="./scoring"):
+    po = "-po" if playoff_mode else ""  # PLAYOFF2021
+    marker = {"date": date, "games": int(no_of_games), "csv": directory + "/scoring-" + date + po + ".csv",
+              "created_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds')}
+    file_name = ready_marker_file(date, playoff_mode, directory)
+    os.makedirs(os.path.dirname(file_name), exist_ok=True)
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "w") as f:
+        json.dump(marker, f)
+    os.replace(tmp_file_name, file_name)
+
+
+# this function returns styled html for the limited scope of columns.
+# Rows are rendered in one pass over the columns (not cell by cell with iloc) and values are HTML-escaped
+def print_scoring_html_styled(games, file_name=r"./scoring/scoring-styled.html"):
     score_df = games[['Start Time ET', 'End Time ET', 'Start Time UTC', 'End Time UTC', 'Visitor',
                       'Host', 'Playoff', 'SCORE: 0 - 100']].copy().sort_values(by=['SCORE: 0 - 100'], ascending=False) # PLAYOFF2021
 
@@ -404,53 +2404,51 @@ def print_scoring_html_styled(games):
     </html>
     '''
 
-    with open(r"c:\tmp\scoring_styled.html", "w") as f:
+    header = "".join('<th>' + html.escape(str(column)) + '</th>' for column in score_df.columns)
+    rows = "".join(
+        '<tr>' + "".join('<td>' + html.escape(str(value)) + '</td>' for value in values) + '</tr>'
+        for values in score_df.itertuples(index=False, name=None)
+    )
+    with open(file_name, "w") as f:
         f.write(html_string_start)
-        f.write(r'<table class="greenTable"><thead><tr>')
-        for header in score_df.columns.values:
-            f.write('<th>' + str(header) + '</th>')
-        f.write('</tr></thead><tbody>')
-        for i in range(len(score_df)):
-            f.write('<tr>')
-            for col in score_df.columns:
-                value = score_df.iloc[i][col]
-                f.write('<td>' + str(value) + '</td>')
-            f.write('</tr>')
+        f.write(r'<table class="greenTable"><thead><tr>' + header + '</tr></thead><tbody>')
+        f.write(rows)
         f.write('</tbody></table>')
         f.write(html_string_end)
 
 
 # this function returns simple html with all data
-def print_scoring_html_plain(games):
-    with open(r"c:\tmp\scoring.html", "w") as p:
+def print_scoring_html_plain(games, file_name=r"./scoring/scoring.html"):
+    with open(file_name, "w") as p:
         p.write(games.sort_values(by=['SCORE: 0 - 100'], ascending=False).to_html())
 
 
-# this function saves calculated ranking into 2 CSV files
-def print_scoring_csv(games, date: str = "", playoff_mode = False):  # PLAYOFF2021
-    # We want print only a subset of columns from games dataframe. We also want present only games that were Finished
-    # And finally we want to sort data starting from the highest scoring
-    score_df = games[['Visitor', 'Host', 'SCORE: 0 - 100']]\
-        .loc[games['Status'] == "Finished"]\
-        .sort_values(by=['SCORE: 0 - 100'], ascending=False)
+# this function saves calculated ranking: as a new snapshot in the ranking store and as a CSV file
+# scoring-yyyy-mm-dd.csv derived from it, that will be overwritten every time cron runs.
+# Earlier snapshots of the day are kept in the store instead of timestamped CSV files
+# directory is the one of the league (League.scoring_dir), ./scoring for the NBA. The ranking store is there too,
+# unless store is given
+def print_scoring_csv(games, date: str = "", playoff_mode = False, store: NBARankingStore = None,
+                      directory="./scoring"):  # PLAYOFF2021
+    if store is None:
+        store = NBARankingStore(directory + "/rankings.sqlite")
+
+    # Only games that were Finished are stored, sorted starting from the highest scoring
+    store.append(games, date, playoff_mode)
 
     if playoff_mode: # PLAYOFF2021
         po = "-po"
     else:
         po = ""
 
-    # First, we write a file with the name that includes time scoring-yyyy-mm-dd-HH-MM.csv
-    time = datetime.datetime.now().strftime('%H%M')
-    with open(r"./scoring/scoring-" + date + " " + time + po + ".csv", "w+") as file: # PLAYOFF2021
-        file.write(score_df.sort_values(by=['SCORE: 0 - 100'], ascending=False).to_csv(index=False))
+    store.export_csv(date, directory + "/scoring-" + date + po + ".csv", playoff_mode)  # PLAYOFF2021
 
-    # The we write to a file that will be overwritten every time cron runs with the name scoring-yyyy-mm-dd.csv
-    with open(r"./scoring/scoring-" + date + po + ".csv", "w+") as file: # PLAYOFF2021
-        file.write(score_df.sort_values(by=['SCORE: 0 - 100'], ascending=False).to_csv(index=False))
+    # signal to the publisher that the ranking is ready
+    write_ready_marker(date, len(games), playoff_mode, directory)
 
 
 # this function dumps data in a json format
-def print_scoring_json(games):
+def print_scoring_json(games, file_name=r"./scoring/scoring.json"):
     games[['Visitor', 'Host', 'SCORE: 0 - 100']].copy()\
         .sort_values(by=['SCORE: 0 - 100'], ascending=False) \
-        .to_json(r'c:\tmp\scoring.json', orient='records', lines=True)
\ No newline at end of file
+        .to_json(file_name, orient='records', lines=True)
\ No newline at end of file
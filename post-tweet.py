@@ -3,16 +3,37 @@ Script posts tweets with the current NBA games ranking.
 
 To be executed as cron process on a server.
 
+The script is started on a small VM, so it is kept light: the ranking is read with the csv module (only the rows
+we tweet), and tweepy and python-dotenv are imported only when we actually post.
+Run with --dry-run to build the post and print it instead of tweeting.
+
+The script can be started together with the scoring job: with --wait SECONDS it waits for the ready marker
+(./scoring/scoring-<date>.ready) that the scoring job writes right after the ranking, and posts at once. If the marker
+does not come before the deadline, the csv file is used as before. Tweets that fail (except bad requests) are kept
+in the outbox (./outbox) and retried by the next runs; --flush-outbox only retries them.
+
 Author: Szymon Manduk
 """
 
-import tweepy
+import argparse
+import csv
 import datetime
-import pandas as pd
-import pytz
+import itertools
+import json
 import os
 import random
-from dotenv import load_dotenv, find_dotenv
+import time
+
+# to limit the length of a tweet we present the first LIMIT games only
+LIMIT = 8
+
+# how often (in seconds) we check if the ranking is ready
+POLL_INTERVAL = 1
+
+# posts that failed are kept here and retried for OUTBOX_MAX_AGE seconds
+OUTBOX_DIR = "./outbox"
+OUTBOX_MAX_AGE = 12 * 60 * 60
+
 
 # function that opens log file and write execution result
 def write_to_log(log):
@@ -27,31 +48,167 @@ def gen_stars(stars):
         str = str + u'\u2B50'
     return str
 
+
+# function reads only the first limit games from the ranking file (the file is sorted from the highest scoring)
+def read_top_games(file_name, limit=LIMIT):
+    with open(file_name, newline='') as f:
+        return list(itertools.islice(csv.DictReader(f), limit))
+
+
+# function creates the twitter client. tweepy and dotenv are imported here, as this is the only place we need them
+def twitter_client():
+    import tweepy
+    from dotenv import load_dotenv, find_dotenv
+
+    # load authentication tokens
+    _ = load_dotenv(find_dotenv(filename='./.env'))
+    consumer_key = os.environ['CONSUMER_KEY']
+    consumer_secret = os.environ['CONSUMER_SECRET']
+    access_token = os.environ['ACCESS_TOKEN']
+    access_token_secret = os.environ['ACCESS_TOKEN_SECRET']
+
+    # authenticate
+    return tweepy.Client(
+        consumer_key=consumer_key,
+        consumer_secret=consumer_secret,
+        access_token=access_token,
+        access_token_secret=access_token_secret
+    )
+
+
+# function waits until the scoring job writes the ready marker of the ranking or the deadline passes.
+# Returns the marker (date, number of games, csv file) or None if the deadline passed
+def wait_for_ranking(marker_file, wait):
+    deadline = time.monotonic() + wait
+    while True:
+        try:
+            with open(marker_file, "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+        if time.monotonic() >= deadline:
+            return None
+        time.sleep(min(POLL_INTERVAL, max(deadline - time.monotonic(), 0)))
+
+
+# Posts that failed to be tweeted are kept in the outbox (one JSON file per date) and retried by the next runs
+def add_to_outbox(name, post, error):
+    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    file_name = os.path.join(OUTBOX_DIR, name + ".json")
+    try:
+        with open(file_name, "r") as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        entry = {"post": post, "created_at": time.time(), "attempts": 0}
+    entry["attempts"] += 1
+    entry["error"] = error
+    tmp_file_name = file_name + ".tmp"
+    with open(tmp_file_name, "w") as f:
+        json.dump(entry, f)
+    os.replace(tmp_file_name, file_name)
+
+
+# function retries posts from the outbox. Posts older than OUTBOX_MAX_AGE are not relevant anymore and are dropped.
+# Returns names of posts that were in the outbox
+def flush_outbox(log):
+    if not os.path.isdir(OUTBOX_DIR):
+        return []
+    names = sorted(f[:-len(".json")] for f in os.listdir(OUTBOX_DIR) if f.endswith(".json"))
+    if len(names) == 0:
+        return []
+
+    client = None
+    for name in names:
+        file_name = os.path.join(OUTBOX_DIR, name + ".json")
+        with open(file_name, "r") as f:
+            entry = json.load(f)
+        if time.time() - entry["created_at"] > OUTBOX_MAX_AGE:
+            os.remove(file_name)
+            write_to_log(log + f"Outbox post {name} dropped after {entry['attempts']} attempts. [300]\n")
+            continue
+
+        if client is None:
+            client = twitter_client()
+        if post_tweet(client, entry["post"], log + f"Retrying outbox post {name}. ", name):
+            os.remove(file_name)
+    return names
+
+
+# function posts the tweet. Returns True if it was posted. Posts that may succeed later are added to the outbox
+def post_tweet(client, post, log, name):
+    import tweepy
+
+    # posting
+    try:
+        status = client.create_tweet(text=post)
+        log += "Tweet successful. Post length: " + str(len(post)) + "\n"
+        write_to_log(log)
+        return True
+    except tweepy.errors.BadRequest as e:
+        # the post itself is wrong, there is no point in retrying it
+        log += f"Bad Request. Unable to post tweet. Post length: {len(post)}. Aborting. [400]\nError: {e.response.text}\n"
+        write_to_log(log)
+        return False
+    except tweepy.errors.Unauthorized as e:
+        log += f"Unauthorized access. Post length: {len(post)}. Queued in outbox. [401]\nError: {e.response.text}\n"
+        add_to_outbox(name, post, str(e))
+    except tweepy.errors.TweepyException as e:
+        log += f"Some generic error occurred: {str(e)}. Queued in outbox.\n"
+        add_to_outbox(name, post, str(e))
+    write_to_log(log)
+    return False
+
+
+# POST_TWEET_WAIT is read from the environment of the process only (e.g. set in post-tweet.sh), not from .env file:
+# dotenv is not loaded until we post (see twitter_client)
+parser = argparse.ArgumentParser(description="Post the ranking of yesterday's NBA games")
+parser.add_argument("--dry-run", action="store_true", help="print the post instead of tweeting it")
+parser.add_argument("--wait", type=float, default=float(os.getenv("POST_TWEET_WAIT", 0)),
+                    help="how many seconds to wait for the ranking to be ready "
+                         "(default: POST_TWEET_WAIT environment variable, not read from .env)")
+parser.add_argument("--flush-outbox", action="store_true", help="only retry posts from the outbox")
+args = parser.parse_args()
+
 # We always ask for yesterday's games.
 yesterday = (datetime.date.today() - datetime.timedelta(days=1))
 now = datetime.datetime.now()
-utc = pytz.utc
-eastern = pytz.timezone('US/Eastern')
 
 # so the filename is:
 file_name = "./scoring/scoring-" + yesterday.strftime('%Y-%m-%d') + ".csv"
+marker_file = "./scoring/scoring-" + yesterday.strftime('%Y-%m-%d') + ".ready"
 
 # let's start logging event & info
 log = now.strftime('%Y-%m-%d %H:%M:%S') + ": "
 
-# we read cvs file using pandas. If failed we log error and exit
+# first we retry posts that failed before. If the post of yesterday was among them, it is not posted again
+name = yesterday.strftime('%Y-%m-%d')
+if not args.dry_run:
+    if name in flush_outbox(log) and not args.flush_outbox:
+        log += "Ranking was already handled by the outbox. [300]\n"
+        write_to_log(log)
+        exit()
+if args.flush_outbox:
+    exit()
+
+# we wait for the scoring job to finish the ranking. If it says there were no games, we log it and exit
+if args.wait > 0:
+    marker = wait_for_ranking(marker_file, args.wait)
+    if marker is None:
+        log += f"Ranking not ready after {args.wait:.0f} s. "
+    elif marker["games"] == 0:
+        log += "No games in the ranking. [200]\n"
+        write_to_log(log)
+        exit()
+
+# we read the first LIMIT games from the csv file. If failed we log error and exit
 try:
-    games = pd.read_csv(file_name)
+    games = read_top_games(file_name)
 except FileNotFoundError:
     log += "Unable to open file: " + file_name + ". Aborting. [100]\n"
     write_to_log(log)
     exit()
 
 # we begin to built post
-# get current time in UTC timezone and convert into Eastern timezone
-time_utc = utc.localize(now)
-time_et = time_utc.astimezone(eastern).strftime('%H:%M')
-
 post_options = [
     "",
     "",
@@ -62,13 +219,10 @@ post_options = [
 ]
 post = "Games for " + yesterday.strftime('%d, %b %Y') + "\n\n" + random.choice(post_options)
 
-
-# to limit the length of a tweet we present the first LIMIT games only
-LIMIT = 8
 n_of_games = 0
-for ind in games.index:
+for game in games:
     # calculating no of stars. 1 - 15 (1), 16 - 27 (2), 28 - 40 (3), 41 - 56 (4), 57 - 100 (5)
-    pts = int(games['SCORE: 0 - 100'][ind])
+    pts = int(game['SCORE: 0 - 100'])
     stars = ""
     if pts <= 15:
         stars = gen_stars(1)
@@ -81,7 +235,7 @@ for ind in games.index:
     elif pts > 56:
         stars = gen_stars(5)
 
-    post = post + games['Visitor'][ind] + "-" + games['Host'][ind] + ": " + \
+    post = post + game['Visitor'] + "-" + game['Host'] + ": " + \
         stars + " (" + str(pts) + ")\n"
     n_of_games += 1
     if n_of_games == LIMIT:
@@ -96,35 +250,8 @@ if n_of_games == 0:
 else:
     log += "Posting ranking with " + str(n_of_games) + " games. "
 
-# load authentication tokens
-_ = load_dotenv(find_dotenv(filename='./.env'))
-consumer_key = os.environ['CONSUMER_KEY']
-consumer_secret = os.environ['CONSUMER_SECRET']
-access_token = os.environ['ACCESS_TOKEN']
-access_token_secret = os.environ['ACCESS_TOKEN_SECRET']
-
-# authenticate
-client = tweepy.Client(
-    consumer_key=consumer_key,
-    consumer_secret=consumer_secret,
-    access_token=access_token,
-    access_token_secret=access_token_secret
-)
-
-# posting
-try:
-    status = client.create_tweet(text=post)
-    log += "Tweet successful. Post length: " + str(len(post)) + "\n"
-    write_to_log(log)
-except tweepy.errors.BadRequest as e:
-    log += f"Bad Request. Unable to post tweet. Post length: {len(post)}. Aborting. [400]\nError: {e.response.text}\n"
-    write_to_log(log)
-    exit()
-except tweepy.errors.Unauthorized as e:
-    log += f"Unauthorized access. Post length: {len(post)}. Aborting. [401]\nError: {e.response.text}\n"
-    write_to_log(log)
-    exit()
-except tweepy.errors.TweepyException as e:
-    log += f"Some generic error occurred: {str(e)}\n"
-    write_to_log(log)
+if args.dry_run:
+    print(post)
     exit()
+
+post_tweet(twitter_client(), post, log, name)
@@ -1,7 +1,8 @@
 # Activate the venv environment
 source /home/ubuntu/nba_venv/bin/activate
 
-# Run script that posts a tweet
-python /home/ubuntu/post-tweet.py
+# Run script that posts a tweet. It waits (up to 2 hours) for the scoring job to mark the ranking as ready,
+# so both jobs can be started at the same time
+python /home/ubuntu/post-tweet.py --wait 7200
 
 deactivate
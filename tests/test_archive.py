@@ -0,0 +1,58 @@
+import json
+import os
+import nbagames as nba
+
+
+def archive_response(archive, kind, date, game_id, body, url="https://api/x", params=None):
+    record = archive.record(url, params)
+    for i in range(0, len(body), 3):
+        record.write(body[i:i + 3])
+    archive.append(kind, date, game_id, record)
+
+
+def test_append_find_read(tmp_path):
+    archive = nba.NBAPayloadArchive(str(tmp_path))
+    archive_response(archive, 'schedule', "2025-01-10", None, b'{"api": {"games": []}}',
+                     url="https://api/games/date/2025-01-10")
+    archive_response(archive, 'box_score', "2025-01-10", "14012", b'{"api": {"statistics": [1]}}')
+    archive_response(archive, 'box_score', "2025-01-11", "14013", b'{"api": {"statistics": [2]}}')
+    archive_response(archive, 'box_score', "2025-01-10", "14012", b'{"api": {"statistics": [3]}}')
+
+    assert len(archive.find()) == 4
+    assert len(archive.find(kind='box_score')) == 3
+    assert len(archive.find(date="2025-01-10")) == 3
+    assert len(archive.find(kind='box_score', game_id="14012")) == 2
+    assert len(archive.find(kind='standings')) == 0
+
+    header, body = archive.read(archive.find(kind='schedule')[0])
+    assert header['url'] == "https://api/games/date/2025-01-10"
+    assert json.loads(body) == {"api": {"games": []}}
+    # the latest response of a game wins
+    assert archive.latest('box_score', game_id="14012") == {"api": {"statistics": [3]}}
+    assert archive.latest('standings') is None
+
+
+def test_torn_entry_is_cut_off(tmp_path):
+    archive = nba.NBAPayloadArchive(str(tmp_path))
+    archive_response(archive, 'box_score', "2025-01-10", "1", b'{"n": 1}')
+    archive_response(archive, 'box_score', "2025-01-10", "2", b'{"n": 2}')
+
+    # an append interrupted in the middle of writing its index entry
+    with open(os.path.join(str(tmp_path), archive.INDEX_FILE), "ab") as index:
+        index.write(b"\x01" * (archive.INDEX_DTYPE.itemsize // 2))
+    assert len(archive.entries()) == 2
+
+    archive_response(archive, 'box_score', "2025-01-10", "3", b'{"n": 3}')
+    assert os.path.getsize(os.path.join(str(tmp_path), archive.INDEX_FILE)) == 3 * archive.INDEX_DTYPE.itemsize
+    assert [archive.latest('box_score', game_id=str(n)) for n in (1, 2, 3)] == [{"n": 1}, {"n": 2}, {"n": 3}]
+
+
+def test_new_segment_when_full(tmp_path):
+    archive = nba.NBAPayloadArchive(str(tmp_path))
+    archive.SEGMENT_SIZE = 200
+    for n in range(10):
+        archive_response(archive, 'box_score', "2025-01-10", str(n + 1), json.dumps({"n": n, "pad": "x" * 40}).encode())
+
+    entries = archive.find(kind='box_score')
+    assert len(set(entries['segment'].tolist())) > 1
+    assert [json.loads(archive.read(entry)[1])["n"] for entry in entries] == list(range(10))
@@ -0,0 +1,67 @@
+import pytest
+import nbagames as nba
+
+HOSTS = nba.NBAGamesDataCollector
+
+
+def game(game_id, v_team_id, h_team_id, v_points, h_points):
+    return nba.ScheduledGame(game_id=game_id, status='Finished', start_time_utc='2025-01-11T01:00:00.000Z',
+                             end_time_utc='2025-01-11T03:15:00.000Z', current_period='4/4',
+                             v_team_id=v_team_id, v_short_name=f"V{game_id}", v_full_name=f"Visitor {game_id}",
+                             v_logo='', v_points=v_points, h_team_id=h_team_id, h_short_name=f"H{game_id}",
+                             h_full_name=f"Host {game_id}", h_logo='', h_points=h_points)
+
+
+GAMES = [
+    game('1', '1', '2', 100, 130),  # a blowout
+    game('2', '3', '4', 100, 101),
+    game('3', '5', '6', 110, 104),
+]
+
+
+# a collector with api-nba calls left today and standings of the given teams (without any files in the repository)
+def collector(tmp_path, monkeypatch, calls_left, teams=('1', '2', '3', '4', '5', '6'),
+              calculator=nba.NBAGamesDataCollector):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("API_ARCHIVE", "0")
+    monkeypatch.setenv("API_CACHE_DIR", str(tmp_path / "responses"))
+    rate_limiter = nba.APIRateLimiter({HOSTS.API_NBA_HOST: (100, calls_left), HOSTS.API_BASKETBALL_HOST: (100, 100)})
+    c = calculator(rate_limiter=rate_limiter, games_state=nba.NBAGamesStateStore(str(tmp_path / "state.json")),
+                   season=2024)
+    c.standings.update([{'teamId': team, 'conference': {'rank': int(team)}, 'winPercentage': 0.5} for team in teams])
+    return c
+
+
+def test_all_box_scores_fit(tmp_path, monkeypatch):
+    c = collector(tmp_path, monkeypatch, calls_left=3)
+    assert c.box_score_budget(GAMES) == 3
+    assert {g.game_id for g in c.plan_box_scores(GAMES)} == {'1', '2', '3'}
+    assert 'box_scores_dropped' not in c.metrics.events
+
+
+def test_box_scores_of_blowouts_are_dropped_first(tmp_path, monkeypatch):
+    c = collector(tmp_path, monkeypatch, calls_left=2)
+    assert c.box_score_budget(GAMES) == 2
+    assert [g.game_id for g in c.plan_box_scores(GAMES)] == ['2', '3']
+    assert c.metrics.events['box_scores_dropped'] == 1
+
+
+def test_standings_of_teams_go_first(tmp_path, monkeypatch):
+    # teams 5 and 6 are not in the standings, so 2 of 3 calls left go to the per-team endpoint
+    c = collector(tmp_path, monkeypatch, calls_left=3, teams=('1', '2', '3', '4'))
+    assert [g.game_id for g in c.plan_box_scores(GAMES)] == ['2']
+    assert c.metrics.events['box_scores_dropped'] == 2
+
+
+def test_quota_too_low_for_standings(tmp_path, monkeypatch):
+    c = collector(tmp_path, monkeypatch, calls_left=1, teams=('1', '2', '3', '4'))
+    with pytest.raises(nba.APIQuotaExceeded):
+        c.plan_box_scores(GAMES)
+
+
+def test_calculator_keeps_box_scores_of_the_best_games(tmp_path, monkeypatch):
+    c = collector(tmp_path, monkeypatch, calls_left=1, calculator=nba.NBAGamesScoringCalculator)
+    # the closest game with both teams at the top of their conferences
+    close_top = game('4', '1', '2', 99, 100)
+    assert [g.game_id for g in c.plan_box_scores(GAMES + [close_top])] == ['4']
+    assert c.metrics.events['box_scores_dropped'] == 3
@@ -0,0 +1,51 @@
+import json
+import pytest
+import nbagames as nba
+
+PLAYERS = [
+    {"points": "41", "totReb": "12", "assists": "10", "steals": "1", "blocks": "0", "comment": "Zażółć"},
+    {"points": "12", "totReb": "10", "assists": "3", "steals": "0", "blocks": "1"},
+    {"points": "7", "totReb": "2", "assists": "1", "steals": "0", "blocks": "0"},
+]
+BODY = json.dumps({"api": {"status": 200, "results": len(PLAYERS), "statistics": PLAYERS}}).encode("utf-8")
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+# every chunk size cuts the body somewhere else: inside the key, inside elements and inside multi-byte characters
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16, 64, len(BODY)])
+def test_iter_json_array_any_chunk_boundaries(size):
+    assert list(nba.iter_json_array(chunked(BODY, size), "statistics")) == PLAYERS
+
+
+def test_iter_json_array_key_split_between_chunks():
+    key_at = BODY.index(b'"statistics"')
+    chunks = [BODY[:key_at + 5], BODY[key_at + 5:]]
+    assert list(nba.iter_json_array(chunks, "statistics")) == PLAYERS
+
+
+def test_iter_json_array_empty_array():
+    assert list(nba.iter_json_array([b'{"statistics": [ ]}'], "statistics")) == []
+
+
+def test_iter_json_array_truncated_body():
+    with pytest.raises(ValueError):
+        list(nba.iter_json_array(chunked(BODY[:len(BODY) // 2], 7), "statistics"))
+
+
+def test_iter_json_array_missing_key():
+    with pytest.raises(KeyError):
+        list(nba.iter_json_array(chunked(b'{"api": {"status": 200, "results": 0}}', 4), "statistics"))
+
+
+def test_extract_box_score():
+    record = nba.extract_box_score(chunked(BODY, 5))
+    assert record == {'results': 3, 'box_score': {'players': 3, 'highest_pts': 41, 'pts_40': 1,
+                                                  'double_doubles': 2, 'triple_doubles': 1}}
+
+
+def test_extract_box_score_errors():
+    assert 'error' in nba.extract_box_score([b'{"api": {"results": 0}}'])
+    assert 'error' in nba.extract_box_score([b'{"statistics": [{"totReb": "3"}]}'])
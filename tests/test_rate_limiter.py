@@ -0,0 +1,79 @@
+import pytest
+import nbagames as nba
+
+
+# a virtual clock: sleeping moves it forward
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def limiter(calls_per_minute=10, calls_per_day=1000):
+    clock = FakeClock()
+    return nba.APIRateLimiter({'host': (calls_per_minute, calls_per_day)}, clock=clock, sleep=clock.sleep), clock
+
+
+def most_calls_in_a_minute(times):
+    return max(sum(1 for other in times if start <= other < start + 60) for start in times)
+
+
+def test_burst_up_to_the_limit_without_waiting():
+    rate_limiter, clock = limiter()
+    for _ in range(10):
+        assert rate_limiter.acquire('host') == 0
+    assert clock.now == 0
+
+
+def test_no_minute_has_more_calls_than_the_limit():
+    rate_limiter, clock = limiter()
+    times = []
+    for _ in range(45):
+        rate_limiter.acquire('host')
+        times.append(clock.now)
+    assert most_calls_in_a_minute(times) == 10
+    assert times[10] == 60
+
+
+def test_calls_spread_over_time_do_not_wait():
+    rate_limiter, clock = limiter()
+    for _ in range(30):
+        assert rate_limiter.acquire('host') == 0
+        clock.now += 6
+
+
+def test_remaining_per_minute_header_is_respected():
+    rate_limiter, clock = limiter()
+    rate_limiter.acquire('host')
+    rate_limiter.update('host', {'X-RateLimit-Remaining': '2'})
+    times = []
+    for _ in range(3):
+        rate_limiter.acquire('host')
+        times.append(clock.now)
+    assert times == [0, 0, 60]
+
+
+def test_retry_after_429():
+    rate_limiter, clock = limiter()
+    rate_limiter.acquire('host')
+    rate_limiter.update('host', {'Retry-After': '30'}, status_code=429)
+    assert rate_limiter.acquire('host') >= 30
+
+
+def test_daily_quota():
+    rate_limiter, clock = limiter(calls_per_day=3)
+    for _ in range(3):
+        rate_limiter.acquire('host')
+    assert rate_limiter.remaining('host') == 0
+    with pytest.raises(nba.APIQuotaExceeded):
+        rate_limiter.acquire('host')
+
+    rate_limiter.update('host', {'x-ratelimit-requests-remaining': '5'})
+    assert rate_limiter.remaining('host') == 5
+    clock.now += 24 * 60 * 60
+    assert rate_limiter.remaining('host') == 3